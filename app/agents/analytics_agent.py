@@ -1,17 +1,8 @@
+import json
 import time
-from langchain_mistralai import ChatMistralAI
 from langchain_core.messages import SystemMessage, HumanMessage
-from app.core.config import settings
 from app.schemas.agent_schemas import AnalyticsMetrics, AgentAnalysisOutput
-from app.services.mcp_service import mcp_manager
-import asyncio
-llm = ChatMistralAI(
-    model="mistral-small-latest", 
-    temperature=0,
-    max_retries=5, 
-    timeout=60,
-    api_key=settings.MISTRAL_API_KEY
-).with_structured_output(AnalyticsMetrics, include_raw=True)
+from app.services.llm_cache import invoke_structured
 
 async def analytics_node(state):
     """
@@ -20,22 +11,27 @@ async def analytics_node(state):
     start_time = time.time()
     from app.agents.orchestrator import track_telemetry
     
-    # Gather pricing from local MCP tool (robust to MCP failures)
-    pricing = await mcp_manager.call_tool(
-        "pricing_client.py",
-        "get_competitor_prices",
-        {"product_url": state["product_url"]},
-    )
+    # Pricing, reviews, inventory and catalog data arrive from the parallel MCP branches
+    tool_results = state.get("tool_results", {})
     
     prompt = [
         SystemMessage(content="You are a Market Analyst. Extract structured metrics."),
-        HumanMessage(content=f"Research: {state['research_data']}\nPricing: {pricing}")
+        HumanMessage(content=(
+            f"Research: {state['research_data']}\n"
+            f"Pricing: {tool_results.get('pricing', 'N/A')}\n"
+            f"Reviews: {tool_results.get('reviews', 'N/A')}\n"
+            f"Inventory: {tool_results.get('inventory', 'N/A')}\n"
+            f"Economics: {tool_results.get('catalog', 'N/A')}"
+        ))
     ]
     
+    # Metrics must come from this run's product data, so only near-identical
+    # research text for the same URL and tool outputs may share a cached response
+    scope = json.dumps({"url": state.get("product_url"), "tools": tool_results}, sort_keys=True, default=str)
+
     try:
-        await asyncio.sleep(1.5)
-        result = await llm.ainvoke(prompt)
-        telemetry = track_telemetry(result['raw'], "analytics", start_time)
+        result, queue_wait, cache_status = await invoke_structured(AnalyticsMetrics, prompt, scope=scope)
+        telemetry = track_telemetry(result['raw'], "analytics", start_time, queue_wait, cache_status)
         
         return {
             "analysis_result": AgentAnalysisOutput(metrics=result['parsed']),
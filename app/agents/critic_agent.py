@@ -1,15 +1,14 @@
 import time
-from langchain_mistralai import ChatMistralAI
-from app.core.config import settings
 from app.schemas.agent_schemas import StrategyCritique
-import asyncio
-llm = ChatMistralAI(
-    model="mistral-small-latest", 
-    temperature=0,
-    max_retries=5, 
-    timeout=60,
-    api_key=settings.MISTRAL_API_KEY
-).with_structured_output(StrategyCritique, include_raw=True)
+from app.services.llm_cache import stream_structured
+from app.services.stream_service import stream_manager
+
+def render_critique(data: dict) -> str:
+    """Display text for a (possibly partial) StrategyCritique, streamed to the UI."""
+    lines = [f"- {p}" for p in data.get("critique_points") or [] if isinstance(p, str)]
+    if isinstance(data.get("recommendation"), str):
+        lines.append(data["recommendation"])
+    return "\n".join(lines)
 
 async def critic_node(state):
     """
@@ -41,19 +40,30 @@ async def critic_node(state):
     )
     
     try:
-        await asyncio.sleep(1.5)
-        result = await llm.ainvoke(prompt)
-        telemetry = track_telemetry(result["raw"], "critic", start_time)
+        async def on_text(text: str):
+            await stream_manager.broadcast_token(state.get("job_id"), text, source="critic")
+
+        async def on_reset():
+            await stream_manager.broadcast_token_reset(state.get("job_id"), source="critic")
+
+        result, queue_wait, cache_status = await stream_structured(
+            StrategyCritique, prompt, render_critique, on_text, on_reset=on_reset,
+            scope=state.get("product_url"),
+        )
+        telemetry = track_telemetry(result["raw"], "critic", start_time, queue_wait, cache_status)
 
         if final_result is not None:
             final_result.critic_review = result["parsed"]
 
         return {
             "analysis_result": final_result,
-            "status": "completed",
+            # Not "completed": broadcast_critic buffers this status, and only
+            # saver_node may mark the job terminal once results are persisted
+            "status": "critique_completed",
             "total_tokens": telemetry["tokens"],
             "total_cost": telemetry["cost"],
             "node_metrics": telemetry["metrics"],
         }
     except Exception as e:
-        return {"status": "failed", "node_metrics": {"critic": {"error": str(e)}}}
\ No newline at end of file
+        # The critique is optional and the job still finishes, so this isn't "failed" either
+        return {"status": "critique_failed", "node_metrics": {"critic": {"error": str(e)}}}
\ No newline at end of file
@@ -0,0 +1,68 @@
+import time
+import urllib.parse
+from typing import Any, Callable, Dict
+from app.services.mcp_service import mcp_manager
+
+
+def product_id_from_url(product_url: str) -> str:
+    """Uses the last path segment of a listing URL as the internal product id."""
+    path_parts = [p for p in urllib.parse.urlparse(product_url).path.split('/') if p]
+    return path_parts[-1] if path_parts else product_url
+
+
+def content_to_text(content: Any) -> str:
+    """Flattens MCP tool content (live objects, cached dicts or error strings) into text."""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for item in content or []:
+        text = item.get("text") if isinstance(item, dict) else getattr(item, "text", None)
+        parts.append(text if text is not None else str(item))
+    return "\n".join(parts)
+
+
+def make_tool_node(
+    node_name: str,
+    client_filename: str,
+    tool_name: str,
+    build_arguments: Callable[[Dict[str, Any]], Dict[str, Any]],
+):
+    """
+    Builds an independent graph branch that runs a single MCP tool and
+    publishes its output under state['tool_results'][node_name].
+    """
+    async def tool_node(state):
+        start_time = time.time()
+        content = await mcp_manager.call_tool(client_filename, tool_name, build_arguments(state))
+        text = content_to_text(content)
+
+        return {
+            "tool_results": {node_name: text},
+            "node_metrics": {
+                node_name: {
+                    "latency_sec": round(time.time() - start_time, 2),
+                    "status": "failed" if text.startswith("Error executing") else "success"
+                }
+            }
+        }
+
+    tool_node.__name__ = f"{node_name}_node"
+    return tool_node
+
+
+pricing_node = make_tool_node(
+    "pricing", "pricing_client.py", "get_competitor_prices",
+    lambda state: {"product_url": state["product_url"]},
+)
+reviews_node = make_tool_node(
+    "reviews", "review_client.py", "analyze_product_reviews",
+    lambda state: {"product_url": state["product_url"]},
+)
+inventory_node = make_tool_node(
+    "inventory", "inventory_client.py", "get_stock_levels",
+    lambda state: {"product_id": product_id_from_url(state["product_url"])},
+)
+catalog_node = make_tool_node(
+    "catalog", "catalog_client.py", "get_product_economics",
+    lambda state: {"product_id": product_id_from_url(state["product_url"])},
+)
@@ -1,19 +1,13 @@
 import time
-from langchain_mistralai import ChatMistralAI
 from app.core.config import settings
 from app.schemas.agent_schemas import OptimizationOutput, AgentAnalysisOutput
-import asyncio
+from app.services.llm_cache import stream_structured
+from app.services.stream_service import stream_manager
 
-# Initialize LLM only if not in demo mode or if key is present
-llm = None
-if getattr(settings, "DEMO_MODE", False) == False and settings.MISTRAL_API_KEY:
-    llm = ChatMistralAI(
-        model="mistral-small-latest", 
-        api_key=settings.MISTRAL_API_KEY,
-        temperature=0,
-    max_retries=5, 
-    timeout=60
-    ).with_structured_output(OptimizationOutput, include_raw=True)
+def render_strategies(data: dict) -> str:
+    """Display text for a (possibly partial) OptimizationOutput, streamed to the UI."""
+    strategies = [s for s in data.get("growth_strategies") or [] if isinstance(s, str)]
+    return "\n".join(f"{i}. {s}" for i, s in enumerate(strategies, start=1))
 
 async def optimization_node(state):
     """
@@ -44,6 +38,9 @@ async def optimization_node(state):
         )
         if current_result:
             current_result.growth_strategy = demo_output
+        await stream_manager.broadcast_token(
+            state.get("job_id"), render_strategies(demo_output.model_dump()), source="optimization"
+        )
         
         end_time = time.time()
         return {
@@ -72,11 +69,20 @@ async def optimization_node(state):
     prompt = f"Based on these metrics: {metrics}, suggest 3 growth strategies for {state.get('product_url')}."
     
     try:
-        if not llm:
+        if not settings.MISTRAL_API_KEY:
             raise ValueError("LLM not initialized. Check MISTRAL_API_KEY.")
-        await asyncio.sleep(1.5)
-        result = await llm.ainvoke(prompt)
-        telemetry = track_telemetry(result['raw'], "optimization", start_time)
+        # Strategies reach the UI token by token while the structured output is generated
+        async def on_text(text: str):
+            await stream_manager.broadcast_token(state.get("job_id"), text, source="optimization")
+
+        async def on_reset():
+            await stream_manager.broadcast_token_reset(state.get("job_id"), source="optimization")
+
+        result, queue_wait, cache_status = await stream_structured(
+            OptimizationOutput, prompt, render_strategies, on_text, on_reset=on_reset,
+            scope=state.get("product_url"),
+        )
+        telemetry = track_telemetry(result['raw'], "optimization", start_time, queue_wait, cache_status)
         
         if current_result:
             current_result.growth_strategy = result['parsed']
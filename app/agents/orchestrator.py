@@ -1,20 +1,18 @@
-import asyncio
 import time
 import operator
-from app.services import job_service
+import weakref
 from typing import TypedDict, List, Optional, Annotated, Dict, Any
-from langgraph.graph import StateGraph, END
-from sqlalchemy.future import select
-from app.db.session import AsyncSessionLocal, engine
-from app.models.job_models import Job
+from langgraph.graph import StateGraph, START, END
 from app.schemas.agent_schemas import AgentAnalysisOutput
 from app.agents.planner_agent import planner_node
 from app.agents.research_agent import research_node
 from app.agents.analytics_agent import analytics_node
 from app.agents.optimization_agent import optimization_node
 from app.agents.critic_agent import critic_node
-from langgraph.checkpoint.memory import MemorySaver
-from app.services.stream_service import stream_manager 
+from app.agents.market_intel_agent import pricing_node, reviews_node, inventory_node, catalog_node
+from app.services.stream_service import stream_manager
+from app.services.status_writer import status_writer
+from app.services.checkpointer import checkpointer_registry
 
 def merge_dicts(a: dict, b: dict) -> dict:
     return {**a, **b}
@@ -27,6 +25,7 @@ class AgentState(TypedDict):
     status: Annotated[str, keep_latest]
     analysis_result: Annotated[Optional[AgentAnalysisOutput], keep_latest]
     research_data: Annotated[List[str], operator.add]
+    tool_results: Annotated[dict, merge_dicts]
     execution_timeline: Annotated[list, operator.add] 
     total_tokens: Annotated[int, operator.add]
     total_cost: Annotated[float, operator.add]
@@ -34,13 +33,20 @@ class AgentState(TypedDict):
     confidence_metrics: Annotated[dict, merge_dicts]
     cost_metrics: Annotated[dict, merge_dicts]
 
-checkpoint_saver = MemorySaver()
 INPUT_COST_PER_1M = 0.20  
 OUTPUT_COST_PER_1M = 0.60
 
-def track_telemetry(response: Any, node_name: str, start_time: float) -> Dict[str, Any]:
+def track_telemetry(
+    response: Any,
+    node_name: str,
+    start_time: float,
+    queue_wait_sec: float = 0.0,
+    cache_status: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     Calculates precise token usage, costs, and latency.
+    queue_wait_sec is the time spent waiting on the shared LLM rate limiter;
+    cache_status ('hit', 'semantic_hit' or 'miss') comes from the response cache.
     """
     duration = time.time() - start_time
     
@@ -57,40 +63,37 @@ def track_telemetry(response: Any, node_name: str, start_time: float) -> Dict[st
     cost = ((prompt_tokens / 1000000) * INPUT_COST_PER_1M) + \
            ((completion_tokens / 1000000) * OUTPUT_COST_PER_1M)
     
+    node_metrics = {
+        "latency_sec": round(duration, 2),
+        "tokens": total_tokens,
+        "cost": round(cost, 6),
+        "queue_wait_sec": round(queue_wait_sec, 2),
+        "status": "success"
+    }
+    if cache_status:
+        node_metrics["cache"] = cache_status
+
     return {
         "tokens": total_tokens,
         "cost": round(cost, 6),
-        "metrics": {
-            node_name: {
-                "latency_sec": round(duration, 2),
-                "tokens": total_tokens,
-                "cost": round(cost, 6),
-                "status": "success"
-            }
-        }
+        "metrics": {node_name: node_metrics}
     }
 
 async def streaming_finalizer_node(state: AgentState):
     """
-    Final node that streams the result to the UI token-by-token.
+    Final node before persistence. Tokens were already streamed live by the
+    optimization and critic agents, so this only publishes the validated
+    strategies in one status event.
     """
     job_id = state.get("job_id")
     final_analysis = state.get("analysis_result")
-    
-    # Broadcast that streaming has started
-    await stream_manager.broadcast_status(job_id, {"status": "streaming_results"})
 
-    if final_analysis and final_analysis.growth_strategy:
-        # Simulate token streaming for the UI from the validated output
-        content = str(final_analysis.growth_strategy.growth_strategies)
-        words = content.split()
-        
-        for word in words:
-            await stream_manager.broadcast_token(job_id, word + " ")
-            # Optional: Small sleep for realistic typing effect
-            await asyncio.sleep(0.02) 
-            
-    return state
+    strategy = final_analysis.growth_strategy if final_analysis else None
+    await stream_manager.broadcast_status(job_id, {
+        "status": "streaming_results",
+        "growth_strategies": strategy.growth_strategies if strategy else [],
+    })
+    return {}
 
 async def broadcaster_node(state: AgentState):
     """
@@ -111,48 +114,44 @@ async def broadcaster_node(state: AgentState):
 
     # 2. Sync to Postgres 'jobs' table for reliability
     # This ensures that even if the worker dies, the UI/API sees the latest node status.
-    async with AsyncSessionLocal() as db:
-        await job_service.update_job_status(
-            db, 
-            job_id, 
-            status=current_status
-        )
+    # Buffered and batched with other jobs' updates; flushed within STATUS_FLUSH_INTERVAL.
+    status_writer.enqueue(job_id, current_status)
         
-    return state
+    return {}
 
 async def saver_node(state: AgentState):
-    """Finalizes job in DB with structured results and observability data."""
-    async with AsyncSessionLocal() as db:
-        try:
-            result = await db.execute(select(Job).filter(Job.id == state["job_id"]))
-            job = result.scalars().first()
-            if job:
-                analysis_data = state.get("analysis_result")
-
-                # Safely serialize the analysis data (Pydantic model or dict)
-                if analysis_data:
-                    if hasattr(analysis_data, "model_dump"):
-                        serialized_analysis = analysis_data.model_dump()
-                    else:
-                        serialized_analysis = dict(analysis_data)
-                else:
-                    serialized_analysis = {}
-
-                job.analysis_result = {
-                    "plan": state.get("research_plan"),
-                    "agent_analysis": serialized_analysis,
-                }
-                job.total_tokens = state.get("total_tokens", 0)
-                job.total_cost = state.get("total_cost", 0.0)
-                job.node_latency = state.get("node_metrics", {})
-                job.status = "completed"
-                await db.commit()
-                
-                await stream_manager.broadcast_status(state["job_id"], {"status": "completed"})
-        except Exception as e:
-            await db.rollback()
-            raise e
-    return state
+    """
+    Finalizes job in DB with structured results and observability data.
+    Every final column and the terminal status go out in a single UPDATE.
+    """
+    analysis_data = state.get("analysis_result")
+
+    # Serialize the analysis data once (Pydantic model or dict)
+    if analysis_data is None:
+        serialized_analysis = {}
+    elif hasattr(analysis_data, "model_dump"):
+        serialized_analysis = analysis_data.model_dump(mode="json")
+    else:
+        serialized_analysis = dict(analysis_data)
+
+    # Terminal status is written synchronously and can't be overtaken by a buffered one
+    await status_writer.write_terminal(
+        state["job_id"],
+        "completed",
+        analysis_result={
+            "plan": state.get("research_plan"),
+            "agent_analysis": serialized_analysis,
+        },
+        total_tokens=state.get("total_tokens", 0),
+        total_cost=state.get("total_cost", 0.0),
+        node_latency=state.get("node_metrics", {}),
+        execution_timeline=state.get("execution_timeline", []),
+        confidence_metrics=state.get("confidence_metrics", {}),
+        cost_metrics=state.get("cost_metrics", {}),
+    )
+
+    await stream_manager.broadcast_status(state["job_id"], {"status": "completed"})
+    return {}
 
 # Graph Construction
 workflow = StateGraph(AgentState)
@@ -160,32 +159,53 @@ workflow = StateGraph(AgentState)
 # Add all nodes including the finalizer
 workflow.add_node("planner", planner_node)
 workflow.add_node("researcher", research_node)
+workflow.add_node("pricing", pricing_node)
+workflow.add_node("reviews", reviews_node)
+workflow.add_node("inventory", inventory_node)
+workflow.add_node("catalog", catalog_node)
 workflow.add_node("analytics", analytics_node)
 workflow.add_node("optimization", optimization_node)
 workflow.add_node("critic", critic_node)
-workflow.add_node("broadcaster", broadcaster_node)
-workflow.add_node("finalizer", streaming_finalizer_node) # Node added
+workflow.add_node("finalizer", streaming_finalizer_node)
 workflow.add_node("saver", saver_node)
 
-workflow.set_entry_point("planner")
+# One broadcaster per stage: a single shared node would fan out to every
+# successor each time it runs.
+for stage in ("planner", "researcher", "analytics", "optimization", "critic"):
+    workflow.add_node(f"broadcast_{stage}", broadcaster_node)
 
 # Execution Flow
-workflow.add_edge("planner", "broadcaster")
-workflow.add_edge("broadcaster", "researcher")
+# Fan-out: MCP lookups don't depend on the plan, so they start alongside the planner
+INTEL_BRANCHES = ["pricing", "reviews", "inventory", "catalog"]
+workflow.add_edge(START, "planner")
+for branch in INTEL_BRANCHES:
+    workflow.add_edge(START, branch)
 
-workflow.add_edge("researcher", "broadcaster")
-workflow.add_edge("broadcaster", "analytics")
+workflow.add_edge("planner", "broadcast_planner")
+workflow.add_edge("broadcast_planner", "researcher")
+workflow.add_edge("researcher", "broadcast_researcher")
 
-workflow.add_edge("analytics", "broadcaster")
-workflow.add_edge("broadcaster", "optimization")
+# Join: analytics waits for research and every MCP branch
+workflow.add_edge(["broadcast_researcher", *INTEL_BRANCHES], "analytics")
 
-workflow.add_edge("optimization", "broadcaster")
-workflow.add_edge("broadcaster", "critic")
+workflow.add_edge("analytics", "broadcast_analytics")
+workflow.add_edge("broadcast_analytics", "optimization")
 
-workflow.add_edge("critic", "broadcaster")
-workflow.add_edge("broadcaster", "finalizer") # Added edge to finalizer
+workflow.add_edge("optimization", "broadcast_optimization")
+workflow.add_edge("broadcast_optimization", "critic")
+
+workflow.add_edge("critic", "broadcast_critic")
+workflow.add_edge("broadcast_critic", "finalizer")
 workflow.add_edge("finalizer", "saver")       # Finalizer leads to DB persistence
 
 workflow.add_edge("saver", END)
 
-app_workflow = workflow.compile(checkpointer=checkpoint_saver)
\ No newline at end of file
+# Compiled once per checkpointer (the durable savers are bound to an event loop)
+_compiled_workflows = weakref.WeakKeyDictionary()
+
+async def get_app_workflow():
+    """Returns the graph compiled with the configured (durable) checkpointer."""
+    saver = await checkpointer_registry.get()
+    if saver not in _compiled_workflows:
+        _compiled_workflows[saver] = workflow.compile(checkpointer=saver)
+    return _compiled_workflows[saver]
\ No newline at end of file
@@ -1,10 +1,8 @@
 import time
 from typing import List
 from pydantic import BaseModel, Field
-from langchain_mistralai import ChatMistralAI
 from langchain_core.messages import SystemMessage, HumanMessage
-from app.core.config import settings
-import asyncio
+from app.services.llm_cache import invoke_structured
 
 # 1. Define the Strict Contract
 class ResearchStep(BaseModel):
@@ -17,14 +15,6 @@ class PlannerOutput(BaseModel):
     steps: List[ResearchStep] = Field(description="List of 3 actionable research steps.")
     estimated_complexity: str = Field(description="Low, Medium, or High.")
 
-# 2. Initialize LLM with Structured Output capability
-llm = ChatMistralAI(
-    model="mistral-small-latest", 
-    temperature=0, 
-    api_key=settings.MISTRAL_API_KEY,
-    max_retries=5, 
-    timeout=60,
-).with_structured_output(PlannerOutput)
 
 async def planner_node(state):
     """
@@ -43,13 +33,14 @@ async def planner_node(state):
     
     try:
         # result contains {'parsed': PlannerOutput, 'raw': AIMessage}
-        await asyncio.sleep(1.5)
-        result = await llm.ainvoke(prompt)
+        result, queue_wait, cache_status = await invoke_structured(
+            PlannerOutput, prompt, scope=state["product_url"]
+        )
         response_model = result['parsed']
         raw_message = result['raw']
         
         # Capture real token usage from the raw AIMessage
-        telemetry = track_telemetry(raw_message, "planner", start_time) 
+        telemetry = track_telemetry(raw_message, "planner", start_time, queue_wait, cache_status) 
         
         return {
             "research_plan": response_model.model_dump_json(),
@@ -1,54 +1,114 @@
+import asyncio
 import time
 import json
+from typing import List, Optional
 import redis.asyncio as redis
-from langchain_mistralai import ChatMistralAI
-from tavily import TavilyClient
+from tavily import AsyncTavilyClient
 from app.core.config import settings
-import asyncio
+from app.services.llm_registry import get_llm
+from app.services.rate_limiter import llm_rate_limiter
+from app.services.single_flight import single_flight
 
 # Shared Redis Client
 redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
-tavily = TavilyClient(api_key=settings.TAVILY_API_KEY)
+# Async client: searches no longer block the worker's event loop
+tavily = AsyncTavilyClient(api_key=settings.TAVILY_API_KEY)
+TAVILY_COST_PER_SEARCH = 0.005 # Standard Tavily basic search cost
+
+def _build_queries(url: str, research_plan: Optional[str]) -> List[str]:
+    """One base query plus one per planner step, capped at RESEARCH_MAX_QUERIES."""
+    queries = [f"Current price and competitors for {url}"]
+    if research_plan:
+        try:
+            steps = json.loads(research_plan).get("steps", [])
+            queries += [f"{step['task']} ({url})" for step in steps]
+        except (ValueError, TypeError, KeyError, AttributeError):
+            pass
+    return queries[:settings.RESEARCH_MAX_QUERIES]
+
+async def _search_all(queries: List[str]) -> List[dict]:
+    """Runs the queries concurrently (bounded) and deduplicates results by URL."""
+    semaphore = asyncio.Semaphore(settings.RESEARCH_SEARCH_CONCURRENCY)
+
+    async def search(query: str) -> List[dict]:
+        async with semaphore:
+            search_result = await tavily.search(query=query, search_depth="basic")
+            return search_result.get('results', [])
+
+    batches = await asyncio.gather(*(search(q) for q in queries), return_exceptions=True)
+    if all(isinstance(b, Exception) for b in batches):
+        raise batches[0]
+
+    seen_urls = set()
+    results = []
+    for batch in batches:
+        if isinstance(batch, Exception):
+            continue
+        for r in batch:
+            if r.get('url') in seen_urls:
+                continue
+            seen_urls.add(r.get('url'))
+            results.append(r)
+    return results
+
+def _summary_result(summary: str, start_time: float, step: str, cache: str) -> dict:
+    """State update for a summary that was already computed (cache hit or coalesced)."""
+    end_time = time.time()
+    return {
+        "research_data": [summary],
+        "status": "research_completed",
+        "execution_timeline": [{
+            "step": step,
+            "start_time": round(start_time, 2),
+            "end_time": round(end_time, 2),
+            "duration_seconds": round(end_time - start_time, 2)
+        }],
+        "confidence_metrics": {"evidence_count": 0},
+        "cost_metrics": {"tavily_cost": 0.0, "llm_cost": 0.0},
+        "node_metrics": {"researcher": {"latency_sec": round(end_time - start_time, 2), "cache": cache}}
+    }
 
 async def research_node(state):
     start_time = time.time()
-    from app.agents.orchestrator import track_telemetry
     
     url = state.get("product_url")
+    summary_key = f"research_summary:{url}"
+    
+    # 1. Check for Cached Summary first (Fastest)
+    cached_summary = await redis_client.get(summary_key)
+    if cached_summary:
+        return _summary_result(cached_summary, start_time, "Market Research (Cache Hit)", "summary_hit")
+
+    # 2. Coalesce concurrent jobs on the same URL: one leader searches and
+    # summarizes, everyone else waits for its cached summary
+    result, led = await single_flight.do(
+        f"research:{url}",
+        load=lambda: redis_client.get(summary_key),
+        compute=lambda: _run_research(url, state.get("research_plan"), start_time),
+    )
+    if led:
+        return result
+    return _summary_result(result, start_time, "Market Research (Coalesced)", "coalesced")
+
+async def _run_research(url: str, research_plan: Optional[str], start_time: float) -> dict:
+    from app.agents.orchestrator import track_telemetry
+
     context_key = f"raw_search_context:{url}"
     summary_key = f"research_summary:{url}"
     
     # Initialize real-data trackers
     evidence_count = 0
     tavily_cost = 0.0
-    
-    # 1. Check for Cached Summary first (Fastest)
-    cached_summary = await redis_client.get(summary_key)
-    if cached_summary:
-        end_time = time.time()
-        return {
-            "research_data": [cached_summary],
-            "status": "research_completed",
-            "execution_timeline": [{
-                "step": "Market Research (Cache Hit)",
-                "start_time": round(start_time, 2),
-                "end_time": round(end_time, 2),
-                "duration_seconds": round(end_time - start_time, 2)
-            }],
-            "confidence_metrics": {"evidence_count": 0},
-            "cost_metrics": {"tavily_cost": 0.0, "llm_cost": 0.0},
-            "node_metrics": {"researcher": {"latency_sec": round(end_time - start_time, 2), "cache": "summary_hit"}}
-        }
 
-    # 2. Check for Cached Raw Search Context (Saves Tavily Credits)
+    # Check for Cached Raw Search Context (Saves Tavily Credits)
     search_context = await redis_client.get(context_key)
     if not search_context:
-        search_result = tavily.search(query=f"Current price and competitors for {url}", search_depth="basic")
-        results_list = search_result.get('results', [])
+        queries = _build_queries(url, research_plan)
+        results_list = await _search_all(queries)
         evidence_count = len(results_list)
         
         search_context = "\n".join([r['content'] for r in results_list])
-        tavily_cost = 0.005 # Standard Tavily basic search cost
+        tavily_cost = TAVILY_COST_PER_SEARCH * len(queries)
         
         # Cache raw context for 24 hours
         await redis_client.set(context_key, search_context, ex=86400)
@@ -56,17 +116,14 @@ async def research_node(state):
         # Estimate evidence from cached text if bypassing search
         evidence_count = len(search_context.split('\n'))
 
-    # 3. Generate Summary
-    llm = ChatMistralAI(model="mistral-small-latest", api_key=settings.MISTRAL_API_KEY,temperature=0,
-    max_retries=5, 
-    timeout=60)
-    await asyncio.sleep(1.5)
-    response = await llm.ainvoke(f"Summarize this research: {search_context}")
+    # Generate Summary
+    llm = get_llm()
+    response, queue_wait = await llm_rate_limiter.invoke(llm, f"Summarize this research: {search_context}")
     
     # Cache the final summary
     await redis_client.set(summary_key, response.content, ex=86400)
     
-    telemetry = track_telemetry(response, "researcher", start_time)
+    telemetry = track_telemetry(response, "researcher", start_time, queue_wait)
     end_time = time.time()
     
     return {
@@ -1,3 +1,4 @@
+from typing import Any, Dict
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
@@ -7,29 +8,45 @@ from app.core.config import settings
 from app.db.session import get_db
 from app.models.user_models import User
 from app.schemas.user_schema import TokenData
+from app.services.auth_cache import RevocationCheckUnavailable, TokenRevoked, auth_cache
 
 # This tells FastAPI where clients should go to get a token
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+def decode_token(token: str) -> Dict[str, Any]:
+    """Verifies the JWT signature and expiry; returns its payload."""
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        raise credentials_exception
+    if payload.get("sub") is None:
+        raise credentials_exception
+    return payload
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme), 
     db: AsyncSession = Depends(get_db)
 ) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
+    # Decode the JWT (CPU only; signature and expiry are always checked)
+    payload = decode_token(token)
+    token_data = TokenData(email=payload["sub"])
+
+    # Polling clients resend the same token: serve the identity from the cache
     try:
-        # Decode the JWT
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email)
-    except JWTError:
+        user = await auth_cache.get(token, payload)
+    except TokenRevoked:
         raise credentials_exception
+    except RevocationCheckUnavailable:
+        # Fail closed: a logged-out token must not work while Redis is down
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Authentication temporarily unavailable")
+    if user is not None:
+        return user
         
     # Fetch user from DB
     result = await db.execute(select(User).filter(User.email == token_data.email))
@@ -37,4 +54,8 @@ async def get_current_user(
     
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+    try:
+        await auth_cache.set(token, payload, user)
+    except TokenRevoked:
+        raise credentials_exception
+    return user
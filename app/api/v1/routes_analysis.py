@@ -1,15 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, Query
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, Query, UploadFile, File, Header
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
+from typing import List, Optional
+import json
 import logging
+import uuid
 
 from app.db.session import get_db
 from app.services import job_service
-from app.schemas.job_schema import JobCreate, JobResponse
-from app.workers.celery_worker import run_agent_pipeline_task
+from app.schemas.job_schema import JobCreate, JobResponse, BulkJobCreate, BulkJobResponse, BatchProgressResponse
+from app.services.job_queue import INTERACTIVE_QUEUE, BULK_QUEUE, RESUME_QUEUE, QueueQuotaExceeded, job_queue
+from app.services.listing_service import ListingService
 from app.services.stream_service import stream_manager
 from app.api.deps import get_current_user
 from app.models.user_models import User
+from app.models.job_models import Job
 from jose import JWTError, jwt
 from app.core.config import settings
 
@@ -17,6 +23,23 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def _quota_exceeded(e: QueueQuotaExceeded) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def _enqueue_or_fail(
+    db: AsyncSession, queue: str, user_id: str, jobs: List[Job], resume: bool = False
+):
+    """
+    Queues the jobs; if the quota check in the enqueue script rejects them
+    (another submission won the race past admit), they are failed so they
+    don't hold their URLs' active slot, and the client gets a 429.
+    """
+    try:
+        await job_queue.enqueue_many(queue, user_id, [(str(job.id), job.product_url) for job in jobs], resume=resume)
+    except QueueQuotaExceeded as e:
+        await job_service.fail_jobs(db, [job.id for job in jobs], "Rejected: job queue quota exceeded")
+        raise _quota_exceeded(e)
+
 @router.post("/analyze", response_model=JobResponse, status_code=202)
 async def start_analysis(
     payload: JobCreate, 
@@ -24,10 +47,106 @@ async def start_analysis(
     current_user: User = Depends(get_current_user) # <-- LOCK APPLIED
 ):
     """Triggers background analysis. Requires valid JWT."""
-    job = await job_service.create_job(db, product_url=payload.product_url)
-    run_agent_pipeline_task.delay(str(job.id), job.product_url)
+    # Admission control: a tenant with a full backlog is told when to retry
+    try:
+        await job_queue.admit(str(current_user.id))
+    except QueueQuotaExceeded as e:
+        raise _quota_exceeded(e)
+
+    job, created = await job_service.create_job(db, product_url=payload.product_url)
+    # A reused active job is already queued or running
+    if created:
+        await _enqueue_or_fail(db, INTERACTIVE_QUEUE, str(current_user.id), [job])
     return job
 
+async def _submit_bulk(db: AsyncSession, user_id: str, raw_urls: List[str]) -> BulkJobResponse:
+    """Validates, deduplicates, creates and dispatches a bulk batch of URLs."""
+    if len(raw_urls) > settings.BULK_MAX_URLS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BULK_MAX_URLS} URLs per batch")
+
+    # 1. Validate and normalize; cleaned URLs dedupe tracking-parameter variants too
+    invalid_urls, urls, seen = [], [], set()
+    for raw in raw_urls:
+        cleaned = ListingService.validate_and_clean_url(raw)
+        if not cleaned:
+            invalid_urls.append(raw)
+        elif cleaned not in seen:
+            seen.add(cleaned)
+            urls.append(cleaned)
+    duplicates = len(raw_urls) - len(invalid_urls) - len(urls)
+
+    # 2. Admission control for the whole batch up front
+    try:
+        await job_queue.admit(user_id, BULK_QUEUE, count=len(urls))
+    except QueueQuotaExceeded as e:
+        raise _quota_exceeded(e)
+
+    # 3. Multi-row insert, then one dispatch for every new job
+    batch_id = uuid.uuid4()
+    created, reused = await job_service.create_jobs_bulk(db, urls, batch_id)
+    await _enqueue_or_fail(db, BULK_QUEUE, user_id, created)
+    if not created and not reused:
+        # Nothing valid was submitted: no batch exists to poll
+        batch_id = None
+    logger.info(
+        f"--- BULK: batch {batch_id} accepted {len(created)}, reused {len(reused)}, "
+        f"duplicates {duplicates}, invalid {len(invalid_urls)} ---"
+    )
+
+    return BulkJobResponse(
+        batch_id=batch_id,
+        accepted=len(created),
+        reused=len(reused),
+        duplicates=duplicates,
+        invalid_urls=invalid_urls,
+        job_ids=[job.id for job in created + reused],
+    )
+
+@router.post("/analyze/bulk", response_model=BulkJobResponse, status_code=202)
+async def start_bulk_analysis(
+    payload: BulkJobCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Queues a list of URLs as one batch on the bulk queue."""
+    return await _submit_bulk(db, str(current_user.id), payload.product_urls)
+
+@router.post("/analyze/bulk/upload", response_model=BulkJobResponse, status_code=202)
+async def upload_bulk_analysis(
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Queues an NDJSON upload as one batch. Each line is either a JSON string
+    or an object with a "product_url" field.
+    """
+    raw_urls = []
+    for line_no, line in enumerate((await file.read()).decode("utf-8").splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail=f"Line {line_no} is not valid JSON")
+        url = record.get("product_url") if isinstance(record, dict) else record
+        if not isinstance(url, str):
+            raise HTTPException(status_code=400, detail=f"Line {line_no} has no product_url")
+        raw_urls.append(url)
+    return await _submit_bulk(db, str(current_user.id), raw_urls)
+
+@router.get("/batches/{batch_id}", response_model=BatchProgressResponse)
+async def get_batch_progress(
+    batch_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Aggregate progress of a bulk batch."""
+    progress = await job_service.get_batch_progress(db, batch_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return progress
+
 @router.get("/status/{job_id}", response_model=JobResponse)
 async def get_analysis_status(
     job_id: UUID, 
@@ -51,10 +170,16 @@ async def resume_analysis(
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    resumable = await job_service.is_job_resumable(db, str(job_id))
-    await job_service.reset_job_for_retry(db, str(job_id))
+    # Completed jobs have nothing to resume; queued or running ones would run twice
+    if job.status != "failed":
+        raise HTTPException(status_code=409, detail=f"Only failed jobs can be resumed (job is {job.status})")
+
+    resumable = await job_service.is_job_resumable(str(job_id))
+    if not await job_service.reset_job_for_retry(db, str(job_id)):
+        raise HTTPException(status_code=409, detail="Job is no longer failed or another active job exists for this URL")
     
-    run_agent_pipeline_task.delay(str(job.id), job.product_url, resume=resumable)
+    # Resumes have their own queue so they never wait behind fresh submissions
+    await _enqueue_or_fail(db, RESUME_QUEUE, str(current_user.id), [job], resume=resumable)
     
     return {
         "job_id": str(job.id), 
@@ -90,31 +215,65 @@ async def get_analysis_result(
         }
     }
 
+def _is_valid_stream_token(token: Optional[str]) -> bool:
+    """Streaming clients authenticate via query param since browsers can't easily send headers."""
+    if not token:
+        return False
+    try:
+        jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return False
+    return True
+
 @router.websocket("/ws/{job_id}")
 async def websocket_endpoint(
     websocket: WebSocket, 
     job_id: str, 
-    token: str = Query(None) # WS auth relies on query params since browsers can't easily send headers in WS
+    token: str = Query(None), # WS auth relies on query params since browsers can't easily send headers in WS
+    last_event_id: Optional[str] = Query(None)
 ):
     """
     Production WebSocket endpoint for real-time agent progress.
-    Secured via token query parameter.
+    Secured via token query parameter. Events already emitted for the job
+    (or only those after last_event_id) are replayed before the live feed.
     """
     # Verify WebSocket Token
-    if not token:
-        await websocket.close(code=1008)
-        return
-    try:
-        jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-    except JWTError:
+    if not _is_valid_stream_token(token):
         await websocket.close(code=1008)
         return
 
     # If valid, accept the connection
-    await stream_manager.connect(job_id, websocket)
+    await stream_manager.connect(job_id, websocket, last_event_id)
     try:
         while True:
             await websocket.receive_text() 
     except WebSocketDisconnect:
-        stream_manager.disconnect(job_id, websocket)
-        logger.info(f"Client disconnected from Job {job_id}")
\ No newline at end of file
+        await stream_manager.disconnect(job_id, websocket)
+        logger.info(f"Client disconnected from Job {job_id}")
+
+@router.get("/sse/{job_id}")
+async def sse_endpoint(
+    job_id: str,
+    token: str = Query(None),
+    last_event_id: Optional[str] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    Server-Sent Events variant of the WebSocket feed. EventSource sends
+    Last-Event-ID on reconnect, so resumption needs no client code.
+    """
+    if not _is_valid_stream_token(token):
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    async def event_source():
+        async for event in stream_manager.event_stream(job_id, last_event_id_header or last_event_id):
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
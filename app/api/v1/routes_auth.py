@@ -1,4 +1,5 @@
 # app/api/v1/routes_auth.py
+import time
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
@@ -6,9 +7,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.db.session import get_db
 from app.models.user_models import User
-from app.schemas.user_schema import UserCreate, UserResponse, Token
+from app.schemas.user_schema import UserCreate, UserResponse, Token, PasswordChange
 from app.core.security import get_password_hash, verify_password, create_access_token
 from app.core.config import settings
+from app.api.deps import oauth2_scheme, decode_token, get_current_user
+from app.services.auth_cache import auth_cache
 
 router = APIRouter()
 
@@ -54,4 +57,48 @@ async def login_access_token(
         data={"sub": user.email}, expires_delta=access_token_expires
     )
     
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    token: str = Depends(oauth2_scheme),
+    current_user: User = Depends(get_current_user)
+):
+    """Revokes the presented token; cached identities for it are dropped everywhere."""
+    await auth_cache.revoke_token(token, decode_token(token))
+
+@router.post("/password", response_model=Token)
+async def change_password(
+    payload: PasswordChange,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Changes the password and invalidates every token issued before the change."""
+    result = await db.execute(select(User).filter(User.id == current_user.id))
+    user = result.scalars().first()
+    if not user or not verify_password(payload.current_password, user.hashed_password):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    # Revoke before committing: if Redis is down the password stays unchanged,
+    # rather than changing while tokens issued under the old one keep working
+    try:
+        await auth_cache.revoke_user(user.email, issued_before=int(time.time()))
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Password change temporarily unavailable",
+        )
+
+    user.hashed_password = get_password_hash(payload.new_password)
+    await db.commit()
+
+    # A fresh token so the caller stays signed in
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": user.email}, expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer"}
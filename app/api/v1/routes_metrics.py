@@ -1,11 +1,17 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
 from app.services.job_service import create_job, get_job
 from app.schemas.job_schema import JobResponse, JobCreate
-from app.agents.orchestrator import app_workflow
+from app.agents.orchestrator import get_app_workflow
 from uuid import UUID
 from app.db.session import get_db
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services import job_service
+from app.services.mcp_service import get_pool_stats
+from app.services.status_writer import get_status_writer_stats
+from app.services.checkpointer import get_checkpoint_memory_stats
+from app.services.job_queue import job_queue
+from app.services.stream_service import get_stream_stats
+from app.services.auth_cache import get_auth_cache_stats
 
 router = APIRouter()
 
@@ -17,6 +23,7 @@ async def run_agent_workflow(job_id: str, product_url: str):
         # Define the configuration with the thread_id
         config = {"configurable": {"thread_id": job_id}} 
         
+        app_workflow = await get_app_workflow()
         await app_workflow.ainvoke(
             {"job_id": job_id, "product_url": product_url},
             config=config # Pass the config here!
@@ -31,20 +38,21 @@ def metrics_ping():
         "timestamp": "2026-03-14T..."}
 
 @router.post("/", response_model=JobResponse)
-async def start_analysis(payload: JobCreate, background_tasks: BackgroundTasks):
+async def start_analysis(payload: JobCreate, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
     """
     Primary endpoint to trigger marketplace analysis.
     """
     try:
         # 1. Initialize the database record
-        job = create_job(product_url=payload.product_url)
+        job, created = await create_job(db, product_url=payload.product_url)
         
-        # 2. Schedule the LangGraph orchestration
-        background_tasks.add_task(
-            run_agent_workflow, 
-            str(job.id), 
-            job.product_url
-        )
+        # 2. Schedule the LangGraph orchestration (skipped when an active job was reused)
+        if created:
+            background_tasks.add_task(
+                run_agent_workflow, 
+                str(job.id), 
+                job.product_url
+            )
         
         # 3. Return the job object directly (Pydantic handles mapping via from_attributes)
         return job
@@ -81,6 +89,48 @@ async def get_job_telemetry(job_id: UUID, db: AsyncSession = Depends(get_db)):
         "performance_breakdown": job.node_latency  # Dictionary of node-by-node latency and cost
     }
     
+@router.get("/mcp/pool")
+async def get_mcp_pool_stats():
+    """
+    Returns MCP session pool hit/spawn counters reported by each worker process.
+    """
+    return {"workers": await get_pool_stats()}
+
+@router.get("/workers/status-writer")
+async def get_status_writer_metrics():
+    """
+    Returns job status flush sizes and lag reported by each worker process.
+    """
+    return {"workers": await get_status_writer_stats()}
+
+@router.get("/workers/checkpoints")
+async def get_checkpoint_memory_metrics():
+    """
+    Returns in-memory checkpoint counts and retained bytes reported by each worker process.
+    """
+    return {"workers": await get_checkpoint_memory_stats()}
+
+@router.get("/queues/stats")
+async def get_queue_stats():
+    """
+    Returns depth and recent wait times for the interactive, bulk and resume queues.
+    """
+    return await job_queue.get_stats()
+
+@router.get("/streams/stats")
+async def get_stream_metrics():
+    """
+    Returns WebSocket connections, send queue depths and evictions reported by each API process.
+    """
+    return {"processes": await get_stream_stats()}
+
+@router.get("/auth/cache")
+async def get_auth_cache_metrics():
+    """
+    Returns token cache hit rates and invalidations reported by each API process.
+    """
+    return {"processes": await get_auth_cache_stats()}
+
 @router.post("/{job_id}/approve")
 async def approve_analysis(job_id: UUID):
     try:
@@ -88,6 +138,7 @@ async def approve_analysis(job_id: UUID):
         config = {"configurable": {"thread_id": str(job_id)}}
         
         # Passing None signals the graph to resume from where it was interrupted
+        app_workflow = await get_app_workflow()
         await app_workflow.ainvoke(None, config=config)
         
         return {"message": "Analysis approved and saved to database."}
@@ -16,9 +16,106 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # --- AUTH CACHE ---
+    AUTH_CACHE_TTL: int = 60
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    AUTH_CACHE_BACKEND: str = "memory"  # memory | redis: redis also shares entries across API processes
+    # Revocations (logout, password change) live in Redis. By default an unreachable Redis
+    # fails authentication closed (503); True accepts tokens unchecked during the outage.
+    AUTH_REVOCATION_FAIL_OPEN: bool = False
+
     WORKER_CONCURRENCY: int = 4
     CELERY_TASK_TRACK_STARTED: bool = True
     CELERY_TASK_TIME_LIMIT: int = 600
+    WORKER_POOL: str = "threads"  # "threads": pipelines share one event loop per process; "prefork": one per process
+    PIPELINE_MAX_IN_FLIGHT: int = 32
+    PIPELINE_TIMEOUT: int = 3600
+
+    # --- JOB QUEUES ---
+    JOB_QUEUE_MAX_BACKLOG_PER_USER: int = 50
+    JOB_QUEUE_MAX_BULK_BACKLOG_PER_USER: int = 5000
+    JOB_QUEUE_MIN_RETRY_AFTER: int = 5
+    JOB_STALE_AFTER: int = 3900  # Must exceed PIPELINE_TIMEOUT: claimed jobs idle this long have no live worker
+
+    # --- BULK ANALYSIS ---
+    BULK_MAX_URLS: int = 5000
+    BULK_INSERT_BATCH_SIZE: int = 1000
+
+    # --- MCP SESSION POOL ---
+    MCP_POOL_MAX_SESSIONS_PER_SERVER: int = 2
+    MCP_POOL_MAX_CALLS_PER_SESSION: int = 16  # Concurrent calls on a session before another is spawned
+    MCP_POOL_IDLE_TIMEOUT: int = 300
+    MCP_POOL_HEALTH_CHECK_INTERVAL: int = 30
+
+    # --- LLM RATE LIMITING ---
+    LLM_RATE_LIMIT_BACKEND: str = "local"  # "local" (per process) or "redis" (shared by all workers)
+    LLM_REQUESTS_PER_MINUTE: int = 60
+    LLM_TOKENS_PER_MINUTE: int = 500000
+    LLM_COMPLETION_TOKEN_ESTIMATE: int = 512
+    LLM_TIMEOUT: int = 60
+    LLM_HTTP_MAX_CONNECTIONS: int = 20
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = 30.0
+
+    # --- LLM RESPONSE CACHE ---
+    LLM_CACHE_TTL: int = 86400
+    LLM_CACHE_MAX_ENTRIES: int = 5000
+    LLM_CACHE_SEMANTIC: bool = False
+    LLM_CACHE_SIMILARITY_THRESHOLD: float = 0.97
+
+    # --- REQUEST COALESCING ---
+    SINGLE_FLIGHT_LOCK_TIMEOUT: int = 120
+
+    # --- RESEARCH SEARCH ---
+    RESEARCH_MAX_QUERIES: int = 4
+    RESEARCH_SEARCH_CONCURRENCY: int = 4
+
+    # --- MCP TOOL HTTP ---
+    MCP_HTTP_CONNECT_TIMEOUT: float = 5.0
+    MCP_HTTP_READ_TIMEOUT: float = 30.0
+    MCP_HTTP_MAX_RETRIES: int = 3
+    MCP_HTTP_BACKOFF_BASE: float = 0.5
+    MCP_HTTP_MAX_CONCURRENCY: int = 10
+
+    # --- KNOWLEDGE BASE INGESTION ---
+    KB_CHUNK_SIZE: int = 500
+    KB_EMBED_BATCH_SIZE: int = 32
+    KB_EMBED_CONCURRENCY: int = 4
+    KB_INSERT_BATCH_SIZE: int = 500
+
+    # --- KNOWLEDGE BASE RETRIEVAL ---
+    KB_HNSW_EF_SEARCH: int = 40
+    # off | strict_order | relaxed_order; anything but off needs pgvector >= 0.8,
+    # where older servers reject the setting and every retrieval would fail
+    KB_HNSW_ITERATIVE_SCAN: str = "off"
+    KB_MAX_DISTANCE: float = 0.4
+
+    # --- EMBEDDING CACHE ---
+    EMBEDDING_CACHE_TTL: int = 604800
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 50000
+
+    # --- JOB STATUS WRITER ---
+    STATUS_FLUSH_INTERVAL: float = 0.5
+    STATUS_FLUSH_MAX_BATCH: int = 500
+
+    # --- CHECKPOINTING ---
+    CHECKPOINT_BACKEND: str = "postgres"  # postgres | redis | memory
+    CHECKPOINT_POOL_MIN_SIZE: int = 1
+    CHECKPOINT_POOL_MAX_SIZE: int = 5
+    CHECKPOINT_COMPRESSION_THRESHOLD: int = 1024
+    CHECKPOINT_RETENTION_DAYS: int = 7
+    CHECKPOINT_MEMORY_MAX_PER_THREAD: int = 3
+    CHECKPOINT_MEMORY_FINISHED_TTL: int = 600
+    CHECKPOINT_MEMORY_IDLE_TTL: int = 3600
+
+    # --- WEBSOCKET STREAMING ---
+    STREAM_SEND_QUEUE_SIZE: int = 256
+    STREAM_TOKEN_POLICY: str = "coalesce"  # coalesce | drop: what happens to tokens for a lagging client
+    STREAM_MAX_LAG_SECONDS: float = 10.0
+    STREAM_SEND_TIMEOUT: float = 5.0
+    STREAM_LOG_MAXLEN: int = 1000
+    STREAM_LOG_TTL: int = 86400
+    STREAM_SSE_KEEPALIVE: float = 15.0
+    STREAM_TOKEN_EMIT_INTERVAL: float = 0.05  # Min seconds between streamed text emits per LLM call
     APP_NAME: str = "Marketplace Growth Copilot"
     DEBUG: bool = False
 
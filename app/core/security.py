@@ -18,7 +18,8 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # iat lets a password change invalidate every token issued before it
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     
     # Sign the JWT using our secret key
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
@@ -0,0 +1,56 @@
+# app/mcp_clients/http_client.py
+import asyncio
+import random
+from typing import Any, Optional
+import httpx
+from app.core.config import settings
+
+# Statuses worth retrying: rate limiting and transient upstream failures
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Shared keep-alive client for the MCP server process. Each MCP server runs
+    a single event loop for its lifetime, so one pooled client is reused by
+    every tool call instead of opening a new connection per request.
+    """
+    global _client, _semaphore
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                settings.MCP_HTTP_READ_TIMEOUT,
+                connect=settings.MCP_HTTP_CONNECT_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.MCP_HTTP_MAX_CONCURRENCY,
+                max_keepalive_connections=settings.MCP_HTTP_MAX_CONCURRENCY,
+            ),
+        )
+        _semaphore = asyncio.Semaphore(settings.MCP_HTTP_MAX_CONCURRENCY)
+    return _client
+
+
+async def request_with_retry(method: str, url: str, **kwargs: Any) -> httpx.Response:
+    """
+    Sends a request through the shared client with a concurrency cap and
+    retries transient failures using exponential backoff with full jitter.
+    Raises the last error once MCP_HTTP_MAX_RETRIES is exhausted.
+    """
+    client = get_http_client()
+    attempts = settings.MCP_HTTP_MAX_RETRIES + 1
+    for attempt in range(attempts):
+        try:
+            async with _semaphore:
+                response = await client.request(method, url, **kwargs)
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == attempts - 1:
+                response.raise_for_status()
+                return response
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            retryable = isinstance(e, httpx.TransportError) or e.response.status_code in RETRYABLE_STATUS_CODES
+            if not retryable or attempt == attempts - 1:
+                raise
+        await asyncio.sleep(random.uniform(0, settings.MCP_HTTP_BACKOFF_BASE * (2 ** attempt)))
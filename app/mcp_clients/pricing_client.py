@@ -1,8 +1,8 @@
 # app/mcp_clients/pricing_client.py
 import urllib.parse
-import requests
 from mcp.server.fastmcp import FastMCP
 from app.core.config import settings
+from app.mcp_clients.http_client import request_with_retry
 
 mcp = FastMCP("PricingServer")
 
@@ -29,8 +29,7 @@ async def get_competitor_prices(product_url: str) -> str:
     }
 
     try:
-        response = requests.get("https://serpapi.com/search", params=params)
-        response.raise_for_status()
+        response = await request_with_retry("GET", "https://serpapi.com/search", params=params)
         data = response.json()
         
         shopping_results = data.get("shopping_results", [])
@@ -1,12 +1,13 @@
 # app/mcp_clients/review_client.py
 import json
 from mcp.server.fastmcp import FastMCP
-from firecrawl import FirecrawlApp
 from pydantic import BaseModel, Field
 from typing import List
 from app.core.config import settings
+from app.mcp_clients.http_client import request_with_retry
 
 mcp = FastMCP("ReviewServer")
+FIRECRAWL_SCRAPE_URL = "https://api.firecrawl.dev/v1/scrape"
 
 # Define the exact JSON structure we want Firecrawl to return
 class ReviewSchema(BaseModel):
@@ -22,18 +23,20 @@ async def analyze_product_reviews(product_url: str) -> str:
         return "System Error: FIRECRAWL_API_KEY is not configured."
 
     try:
-        app = FirecrawlApp(api_key=settings.FIRECRAWL_API_KEY)
-        
         # Tell Firecrawl to scrape the URL and extract data matching our Pydantic Schema
-        data = app.scrape_url(
-            product_url, 
-            params={
+        response = await request_with_retry(
+            "POST",
+            FIRECRAWL_SCRAPE_URL,
+            headers={"Authorization": f"Bearer {settings.FIRECRAWL_API_KEY}"},
+            json={
+                'url': product_url,
                 'formats': ['extract'],
                 'extract': {
                     'schema': ReviewSchema.model_json_schema()
                 }
             }
         )
+        data = response.json().get('data', {})
         
         extracted_data = data.get('extract', {})
         if not extracted_data:
@@ -1,9 +1,13 @@
 import uuid
-from sqlalchemy import Column, String, DateTime, Text, Float, Integer, JSON
+from sqlalchemy import Column, String, DateTime, Text, Float, Integer, JSON, Index, ForeignKey, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from datetime import datetime
 from app.db.base import Base
 
+# Every non-terminal status counts as an in-flight job for the idempotency
+# check: the pipeline moves through planning_completed, research_completed, ...
+ACTIVE_JOB_PREDICATE = "status NOT IN ('completed', 'failed')"
+
 class Job(Base):
     """
     Main job tracking table.
@@ -17,7 +21,7 @@ class Job(Base):
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     product_url = Column(String, nullable=False)
-    
+
     # Status tracks the agentic pipeline: pending -> researching -> analyzing -> completed
     status = Column(String, default="pending", nullable=False)
     
@@ -31,4 +35,25 @@ class Job(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     execution_timeline = Column(JSON, default=list)
     confidence_metrics = Column(JSON, default=dict)
-    cost_metrics = Column(JSON, default=dict)
\ No newline at end of file
+    cost_metrics = Column(JSON, default=dict)
+
+    # At most one active job per URL; also serves the create_job lookup
+    __table_args__ = (
+        Index(
+            "uq_jobs_active_product_url",
+            "product_url",
+            unique=True,
+            postgresql_where=text(ACTIVE_JOB_PREDICATE),
+        ),
+    )
+
+
+class JobBatchMember(Base):
+    """
+    Membership of jobs in bulk batches. A job reused by a later batch (its URL
+    was still active) belongs to every batch that submitted it.
+    """
+    __tablename__ = "job_batch_members"
+
+    batch_id = Column(UUID(as_uuid=True), primary_key=True)
+    job_id = Column(UUID(as_uuid=True), ForeignKey("jobs.id", ondelete="CASCADE"), primary_key=True, index=True)
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, ForeignKey, Text
+from sqlalchemy import Column, ForeignKey, Text, Index
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from pgvector.sqlalchemy import Vector
 from app.db.base import Base
@@ -12,11 +12,36 @@ class ProductEmbedding(Base):
     __tablename__ = "product_embeddings"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    job_id = Column(UUID(as_uuid=True), ForeignKey("jobs.id"), nullable=False)
+    job_id = Column(UUID(as_uuid=True), ForeignKey("jobs.id"), nullable=False, index=True)
     
     # FIX: 1024 is the standard dimension for Mistral 'mistral-embed' model
     embedding = Column(Vector(1024)) 
     
     # Store the original text snippet and metadata for context
     content = Column(Text, nullable=False)
-    payload_metadata = Column(JSONB, nullable=True)
\ No newline at end of file
+    payload_metadata = Column(JSONB, nullable=True)
+
+    # Approximate nearest-neighbour index for cosine-distance retrieval
+    __table_args__ = (
+        Index(
+            "ix_product_embeddings_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    )
+
+
+class LLMCacheVector(Base):
+    """
+    Prompt embeddings for the LLM response cache's semantic lookup; the
+    responses themselves live in Redis and a row is dropped with its entry.
+    """
+    __tablename__ = "llm_cache_vectors"
+
+    key = Column(Text, primary_key=True)
+
+    # model:schema:scope digest, so a lookup only compares prompts for the same job inputs
+    namespace = Column(Text, nullable=False, index=True)
+    embedding = Column(Vector(1024), nullable=False)
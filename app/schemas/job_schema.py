@@ -28,4 +28,25 @@ class JobResponse(BaseModel):
     model_config = ConfigDict(
         from_attributes=True,   # Replaces orm_mode = True
         populate_by_name=True   # Allows the API to accept/return 'job_id'
-    )
\ No newline at end of file
+    )
+
+class BulkJobCreate(BaseModel):
+    product_urls: List[str]
+
+class BulkJobResponse(BaseModel):
+    """Outcome of a bulk submission; progress is polled via the batch id (None when no job was queued)."""
+    batch_id: Optional[UUID] = None
+    accepted: int
+    reused: int
+    duplicates: int
+    invalid_urls: List[str] = []
+    job_ids: List[UUID] = []
+
+class BatchProgressResponse(BaseModel):
+    batch_id: UUID
+    total: int
+    completed: int
+    failed: int
+    in_progress: int
+    percent_complete: float
+    by_status: Dict[str, int]
@@ -0,0 +1,259 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+from uuid import UUID
+import redis.asyncio as redis
+from app.core.config import settings
+from app.models.user_models import User
+from app.services.process_stats import ProcessStatsPublisher, read_process_stats
+
+logger = logging.getLogger(__name__)
+
+AUTH_INVALIDATION_CHANNEL = "auth_invalidations"
+AUTH_CACHE_STATS_KEY = "auth_cache_stats"
+
+
+class TokenRevoked(Exception):
+    """Raised for a token that was logged out or predates a password change."""
+
+
+class RevocationCheckUnavailable(Exception):
+    """Raised when Redis can't be reached to check revocations (see AUTH_REVOCATION_FAIL_OPEN)."""
+
+
+class AuthCache:
+    """
+    Short-lived cache of verified token -> user identity for get_current_user.
+
+    Entries live in a size-bounded in-process LRU for at most AUTH_CACHE_TTL
+    (never past the token's own expiry); with the 'redis' backend a shared
+    second tier lets other API processes skip Postgres too. Logout revokes
+    the token and a password change invalidates every token issued before
+    it: both are recorded in Redis, checked on each local miss and again
+    before a looked-up identity is stored, and broadcast so every process
+    drops its local entries immediately.
+    """
+
+    def __init__(
+        self,
+        ttl: int = settings.AUTH_CACHE_TTL,
+        max_entries: int = settings.AUTH_CACHE_MAX_ENTRIES,
+        backend: str = settings.AUTH_CACHE_BACKEND,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = backend == "redis"
+        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        # token hash -> (monotonic expiry, identity)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._by_email: Dict[str, Set[str]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._stats_publisher = ProcessStatsPublisher(AUTH_CACHE_STATS_KEY)
+        self.stats = {
+            "local_hits": 0, "shared_hits": 0, "misses": 0, "rejected": 0, "invalidations": 0, "unavailable": 0,
+        }
+
+    @staticmethod
+    def token_key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @staticmethod
+    def _to_user(identity: Dict[str, Any]) -> User:
+        # Detached User carrying only the identity columns
+        return User(
+            id=UUID(identity["id"]),
+            email=identity["email"],
+            created_at=datetime.fromisoformat(identity["created_at"]) if identity.get("created_at") else None,
+        )
+
+    def _ensure_listener(self):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def get(self, token: str, payload: Dict[str, Any]) -> Optional[User]:
+        """
+        Returns the cached user for a verified token, or None on a miss.
+        Raises TokenRevoked if the token was invalidated.
+        """
+        self._ensure_listener()
+        key = self.token_key(token)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats["local_hits"] += 1
+                await self._stats_publisher.publish(self.redis_client, self.get_stats)
+                return self._to_user(entry[1])
+            self._drop(key)
+
+        # Local miss: one round trip checks revocations (and the shared tier)
+        try:
+            shared = await self._check_revoked(key, payload, fetch_shared=self.shared)
+        except RevocationCheckUnavailable:
+            if not settings.AUTH_REVOCATION_FAIL_OPEN:
+                raise
+            self.stats["misses"] += 1
+            return None
+
+        if shared:
+            identity = json.loads(shared)
+            self._store_local(key, identity, payload)
+            self.stats["shared_hits"] += 1
+            await self._stats_publisher.publish(self.redis_client, self.get_stats)
+            return self._to_user(identity)
+
+        self.stats["misses"] += 1
+        await self._stats_publisher.publish(self.redis_client, self.get_stats)
+        return None
+
+    async def _check_revoked(self, key: str, payload: Dict[str, Any], fetch_shared: bool = False) -> Optional[str]:
+        """
+        Raises TokenRevoked for a logged-out or pre-password-change token, or
+        RevocationCheckUnavailable if Redis can't answer. Returns the shared
+        cache entry when fetch_shared is set.
+        """
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.exists(f"auth_revoked:{key}")
+                pipe.get(f"auth_valid_after:{payload.get('sub')}")
+                if fetch_shared:
+                    pipe.get(f"auth_cache:{key}")
+                results = await pipe.execute()
+        except Exception as cache_err:
+            self.stats["unavailable"] += 1
+            logger.warning(f"Auth revocation check failed: {cache_err}")
+            raise RevocationCheckUnavailable() from cache_err
+        revoked, valid_after = results[0], results[1]
+        if revoked or payload.get("iat", 0) < float(valid_after or 0):
+            self.stats["rejected"] += 1
+            raise TokenRevoked()
+        return results[2] if fetch_shared else None
+
+    async def set(self, token: str, payload: Dict[str, Any], user: User):
+        """
+        Caches the identity looked up for a token. Revocation is checked
+        again first: a logout or password change may have landed while the
+        caller was querying Postgres, and caching then would resurrect the
+        token for up to AUTH_CACHE_TTL. Raises TokenRevoked in that case.
+        """
+        key = self.token_key(token)
+        try:
+            await self._check_revoked(key, payload)
+        except RevocationCheckUnavailable:
+            # Only reachable when failing open: serve the request but don't cache it
+            return
+        identity = {
+            "id": str(user.id),
+            "email": user.email,
+            "created_at": user.created_at.isoformat() if user.created_at else None,
+        }
+        ttl = self._store_local(key, identity, payload)
+        if self.shared and ttl > 0:
+            try:
+                await self.redis_client.set(f"auth_cache:{key}", json.dumps(identity), ex=max(1, int(ttl)))
+            except Exception as cache_err:
+                logger.warning(f"Auth cache write failed: {cache_err}")
+
+    def _store_local(self, key: str, identity: Dict[str, Any], payload: Dict[str, Any]) -> float:
+        ttl = self.ttl
+        if payload.get("exp"):
+            ttl = min(ttl, payload["exp"] - time.time())
+        if ttl <= 0:
+            return 0
+        self._entries[key] = (time.monotonic() + ttl, identity)
+        self._entries.move_to_end(key)
+        self._by_email.setdefault(identity["email"], set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+        return ttl
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_email.get(entry[1]["email"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_email[entry[1]["email"]]
+
+    def _drop_email(self, email: str):
+        for key in list(self._by_email.get(email, ())):
+            self._drop(key)
+
+    async def revoke_token(self, token: str, payload: Dict[str, Any]):
+        """Logout: the token is rejected until it would have expired anyway."""
+        key = self.token_key(token)
+        remaining = max(1, int(payload.get("exp", time.time() + self.ttl) - time.time()))
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(f"auth_revoked:{key}", 1, ex=remaining)
+            pipe.delete(f"auth_cache:{key}")
+            pipe.publish(AUTH_INVALIDATION_CHANNEL, json.dumps({"token": key}))
+            await pipe.execute()
+        self._drop(key)
+        self.stats["invalidations"] += 1
+
+    async def revoke_user(self, email: str, issued_before: int):
+        """
+        Password change: rejects every token for the user whose iat (whole
+        seconds) is before issued_before.
+        """
+        token_lifetime = settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(f"auth_valid_after:{email}", issued_before, ex=token_lifetime)
+            pipe.publish(AUTH_INVALIDATION_CHANNEL, json.dumps({"email": email}))
+            await pipe.execute()
+        # Shared entries are keyed by token, so they are caught by the
+        # valid-after check on the next local miss instead of being deleted here
+        self._drop_email(email)
+        self.stats["invalidations"] += 1
+
+    async def _listen(self):
+        """Drops local entries invalidated by other API processes."""
+        while True:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(AUTH_INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    event = json.loads(message["data"])
+                    if "token" in event:
+                        self._drop(event["token"])
+                    elif "email" in event:
+                        self._drop_email(event["email"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as bus_err:
+                logger.warning(f"--- AUTH CACHE: invalidation listener failed, clearing cache: {bus_err} ---")
+                # Invalidations may have been missed while disconnected
+                self._entries.clear()
+                self._by_email.clear()
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = self.stats["local_hits"] + self.stats["shared_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+auth_cache = AuthCache()
+
+
+async def get_auth_cache_stats() -> Dict[str, Any]:
+    """Returns auth cache stats published by every API process."""
+    return await read_process_stats(auth_cache.redis_client, AUTH_CACHE_STATS_KEY)
@@ -0,0 +1,325 @@
+import asyncio
+import inspect
+import logging
+import time
+import weakref
+import zlib
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+import redis.asyncio as redis
+from pydantic import BaseModel
+from app.core.config import settings
+from app.schemas import agent_schemas
+from app.services.process_stats import ProcessStatsPublisher, read_process_stats
+
+logger = logging.getLogger(__name__)
+
+redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+CHECKPOINT_MEMORY_STATS_KEY = "checkpoint_memory_stats"
+
+# Latest checkpoint per namespace; older checkpoints of a finished thread are dead weight
+_PRUNE_THREAD_SQL = [
+    """
+    DELETE FROM checkpoint_writes w
+    WHERE w.thread_id = %(thread_id)s AND w.checkpoint_id < (
+        SELECT max(c.checkpoint_id) FROM checkpoints c
+        WHERE c.thread_id = w.thread_id AND c.checkpoint_ns = w.checkpoint_ns
+    )
+    """,
+    """
+    DELETE FROM checkpoints c
+    WHERE c.thread_id = %(thread_id)s AND c.checkpoint_id < (
+        SELECT max(l.checkpoint_id) FROM checkpoints l
+        WHERE l.thread_id = c.thread_id AND l.checkpoint_ns = c.checkpoint_ns
+    )
+    """,
+    # Blobs are versioned per channel; drop versions no remaining checkpoint points at
+    """
+    DELETE FROM checkpoint_blobs b
+    WHERE b.thread_id = %(thread_id)s AND NOT EXISTS (
+        SELECT 1 FROM checkpoints c
+        WHERE c.thread_id = b.thread_id AND c.checkpoint_ns = b.checkpoint_ns
+          AND c.checkpoint -> 'channel_versions' ->> b.channel = b.version
+    )
+    """,
+]
+
+_EXPIRED_THREADS_SQL = """
+    SELECT thread_id FROM checkpoints
+    GROUP BY thread_id
+    HAVING max((checkpoint ->> 'ts')::timestamptz) < now() - make_interval(days => %(days)s)
+"""
+_PRUNE_EXPIRED_INTERVAL = 3600
+
+
+class CompressedSerializer(SerializerProtocol):
+    """
+    Wraps the msgpack serializer and zlib-compresses payloads above a size
+    threshold. AgentState carries full research text, which compresses well.
+    The '+zlib' type suffix keeps uncompressed blobs readable.
+    """
+
+    def __init__(self, serde: SerializerProtocol, threshold: int = settings.CHECKPOINT_COMPRESSION_THRESHOLD):
+        self.serde = serde
+        self.threshold = threshold
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        typ, data = self.serde.dumps_typed(obj)
+        if len(data) < self.threshold:
+            return typ, data
+        return f"{typ}+zlib", zlib.compress(data)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        typ, payload = data
+        if typ.endswith("+zlib"):
+            return self.serde.loads_typed((typ.removesuffix("+zlib"), zlib.decompress(payload)))
+        return self.serde.loads_typed(data)
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    In-process saver whose memory stays bounded on long-lived workers.
+
+    Each thread keeps only its latest `max_per_thread` checkpoints (with their
+    pending writes and the channel blobs they reference). Threads are evicted
+    `finished_ttl` seconds after mark_finished(), or after `idle_ttl` seconds
+    without a new checkpoint (e.g. a job whose worker crashed).
+    """
+
+    def __init__(
+        self,
+        *,
+        serde: Optional[SerializerProtocol] = None,
+        max_per_thread: int = settings.CHECKPOINT_MEMORY_MAX_PER_THREAD,
+        finished_ttl: int = settings.CHECKPOINT_MEMORY_FINISHED_TTL,
+        idle_ttl: int = settings.CHECKPOINT_MEMORY_IDLE_TTL,
+    ):
+        super().__init__(serde=serde)
+        self.max_per_thread = max_per_thread
+        self.finished_ttl = finished_ttl
+        self.idle_ttl = idle_ttl
+        # (thread_id, checkpoint_ns, checkpoint_id) -> channel versions it references
+        self._channel_versions: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._last_put: Dict[str, float] = {}
+        self._finished: Dict[str, float] = {}
+        self._last_sweep = time.monotonic()
+        self.stats = {"trimmed_checkpoints": 0, "evicted_threads": 0}
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        self._channel_versions[(thread_id, checkpoint_ns, checkpoint["id"])] = dict(checkpoint["channel_versions"])
+        self._last_put[thread_id] = time.monotonic()
+        self._trim(thread_id, checkpoint_ns)
+        self.evict_expired()
+        return next_config
+
+    def _trim(self, thread_id: str, checkpoint_ns: str):
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        overflow = len(checkpoints) - self.max_per_thread
+        if overflow <= 0:
+            return
+        # Insertion order is chronological
+        for checkpoint_id in list(checkpoints)[:overflow]:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self._channel_versions.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        self.stats["trimmed_checkpoints"] += overflow
+
+        referenced = {
+            (channel, version)
+            for checkpoint_id in checkpoints
+            for channel, version in self._channel_versions.get((thread_id, checkpoint_ns, checkpoint_id), {}).items()
+        }
+        for key in [k for k in self.blobs if k[0] == thread_id and k[1] == checkpoint_ns]:
+            if (key[2], key[3]) not in referenced:
+                del self.blobs[key]
+
+    def mark_finished(self, thread_id: str):
+        """Starts the finished-thread TTL; the thread stays readable until it expires."""
+        self._finished[thread_id] = time.monotonic()
+
+    def evict_expired(self, sweep_interval: float = 60.0):
+        now = time.monotonic()
+        if now - self._last_sweep < sweep_interval:
+            return
+        self._last_sweep = now
+        expired = [t for t, at in self._finished.items() if now - at > self.finished_ttl]
+        expired += [t for t, at in self._last_put.items() if now - at > self.idle_ttl and t not in self._finished]
+        for thread_id in expired:
+            self.delete_thread(thread_id)
+        self.stats["evicted_threads"] += len(expired)
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        for key in [k for k in self._channel_versions if k[0] == thread_id]:
+            del self._channel_versions[key]
+        self._last_put.pop(thread_id, None)
+        self._finished.pop(thread_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Gauge of retained checkpoint data (serialized payload bytes) in this process."""
+        checkpoint_bytes = sum(
+            len(saved[0][1]) + len(saved[1][1])
+            for namespaces in self.storage.values()
+            for checkpoints in namespaces.values()
+            for saved in checkpoints.values()
+        )
+        blob_bytes = sum(len(blob[1]) for blob in self.blobs.values())
+        write_bytes = sum(len(w[2][1]) for writes in self.writes.values() for w in writes.values())
+        return {
+            **self.stats,
+            "threads": len(self.storage),
+            "finished_threads": len(self._finished),
+            "checkpoints": sum(len(c) for ns in self.storage.values() for c in ns.values()),
+            "blobs": len(self.blobs),
+            "bytes": checkpoint_bytes + blob_bytes + write_bytes,
+        }
+
+
+def checkpoint_serde() -> SerializerProtocol:
+    # Only our own agent schemas may be revived from checkpoint blobs
+    schema_types = [
+        obj for obj in vars(agent_schemas).values()
+        if inspect.isclass(obj) and issubclass(obj, BaseModel) and obj.__module__ == agent_schemas.__name__
+    ]
+    return CompressedSerializer(JsonPlusSerializer(allowed_msgpack_modules=schema_types))
+
+
+def _psycopg_conninfo(database_url: str) -> str:
+    """Converts the SQLAlchemy asyncpg URL into a libpq URL with the same TLS requirement."""
+    parts = urlsplit(database_url.replace("postgresql+asyncpg://", "postgresql://", 1))
+    query = dict(parse_qsl(parts.query))
+    query.pop("ssl", None)
+    query.setdefault("sslmode", "require")
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class CheckpointerRegistry:
+    """
+    Provides the LangGraph checkpointer selected by CHECKPOINT_BACKEND.
+
+    'postgres' (default) stores checkpoints in Postgres through a pooled
+    psycopg connection, 'redis' uses langgraph-checkpoint-redis with a TTL,
+    and 'memory' keeps them in this process only. Pools are bound to the
+    event loop that opened them, so each loop gets its own saver.
+    """
+
+    def __init__(self, backend: str = settings.CHECKPOINT_BACKEND):
+        self.backend = backend
+        self._savers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, BaseCheckpointSaver]" = weakref.WeakKeyDictionary()
+        self._locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+        self._memory_saver: Optional[BoundedMemorySaver] = None
+        self._last_expiry_prune = 0.0
+        # Published once per finished thread rather than on a timer
+        self._stats_publisher = ProcessStatsPublisher(CHECKPOINT_MEMORY_STATS_KEY, interval=0)
+
+    async def get(self) -> BaseCheckpointSaver:
+        if self.backend == "memory":
+            if self._memory_saver is None:
+                self._memory_saver = BoundedMemorySaver(serde=checkpoint_serde())
+            return self._memory_saver
+
+        loop = asyncio.get_running_loop()
+        async with self._locks.setdefault(loop, asyncio.Lock()):
+            if loop not in self._savers:
+                self._savers[loop] = await self._create()
+            return self._savers[loop]
+
+    async def _create(self) -> BaseCheckpointSaver:
+        if self.backend == "postgres":
+            from psycopg.rows import dict_row
+            from psycopg_pool import AsyncConnectionPool
+            from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+            pool = AsyncConnectionPool(
+                _psycopg_conninfo(settings.DATABASE_URL),
+                min_size=settings.CHECKPOINT_POOL_MIN_SIZE,
+                max_size=settings.CHECKPOINT_POOL_MAX_SIZE,
+                # Required by AsyncPostgresSaver; no server-side prepares for pooled Neon endpoints
+                kwargs={"autocommit": True, "prepare_threshold": 0, "row_factory": dict_row},
+                open=False,
+            )
+            await pool.open()
+            saver = AsyncPostgresSaver(conn=pool, serde=checkpoint_serde())
+            await saver.setup()
+        elif self.backend == "redis":
+            try:
+                from langgraph.checkpoint.redis.aio import AsyncRedisSaver
+            except ImportError:
+                raise ImportError(
+                    "CHECKPOINT_BACKEND=redis requires langgraph-checkpoint-redis "
+                    "(and a Redis server with the JSON and Search modules)."
+                ) from None
+            # Expired checkpoints are removed by Redis itself
+            saver = AsyncRedisSaver(
+                redis_url=settings.REDIS_URL,
+                ttl={"default_ttl": settings.CHECKPOINT_RETENTION_DAYS * 24 * 60, "refresh_on_read": True},
+            )
+            saver.serde = checkpoint_serde()
+            await saver.asetup()
+        else:
+            raise ValueError(f"Unknown CHECKPOINT_BACKEND: {self.backend}")
+
+        logger.info(f"--- CHECKPOINTER: {self.backend} ready ---")
+        return saver
+
+    async def get_latest(self, thread_id: str) -> Optional[CheckpointTuple]:
+        saver = await self.get()
+        return await saver.aget_tuple({"configurable": {"thread_id": thread_id}})
+
+    async def prune_thread(self, thread_id: str):
+        """Keeps only the latest checkpoint of a finished thread."""
+        if self.backend == "memory":
+            (await self.get()).mark_finished(thread_id)
+            await self._stats_publisher.publish(redis_client, self._memory_saver.get_stats)
+            return
+        if self.backend != "postgres":
+            return
+        saver = await self.get()
+        try:
+            async with saver.conn.connection() as conn:
+                async with conn.transaction():
+                    for statement in _PRUNE_THREAD_SQL:
+                        await conn.execute(statement, {"thread_id": thread_id})
+        except Exception as prune_err:
+            logger.warning(f"Checkpoint prune failed for {thread_id}: {prune_err}")
+
+    async def prune_expired(self):
+        """Deletes threads idle for CHECKPOINT_RETENTION_DAYS, at most once an hour per process."""
+        if self.backend == "memory":
+            (await self.get()).evict_expired()
+            return
+        if self.backend != "postgres" or time.monotonic() - self._last_expiry_prune < _PRUNE_EXPIRED_INTERVAL:
+            return
+        self._last_expiry_prune = time.monotonic()
+        saver = await self.get()
+        try:
+            async with saver.conn.connection() as conn:
+                cursor = await conn.execute(_EXPIRED_THREADS_SQL, {"days": settings.CHECKPOINT_RETENTION_DAYS})
+                expired = [row["thread_id"] for row in await cursor.fetchall()]
+            for thread_id in expired:
+                await saver.adelete_thread(thread_id)
+            if expired:
+                logger.info(f"--- CHECKPOINTER: Pruned {len(expired)} expired threads ---")
+        except Exception as prune_err:
+            logger.warning(f"Expired checkpoint prune failed: {prune_err}")
+
+    async def aclose(self):
+        """Closes the connection pool bound to the running loop."""
+        saver = self._savers.pop(asyncio.get_running_loop(), None)
+        if saver is not None and self.backend == "postgres":
+            await saver.conn.close()
+
+
+checkpointer_registry = CheckpointerRegistry()
+
+
+async def get_checkpoint_memory_stats() -> Dict[str, Any]:
+    """Returns in-memory checkpoint gauges published by every worker process."""
+    return await read_process_stats(redis_client, CHECKPOINT_MEMORY_STATS_KEY)
@@ -0,0 +1,93 @@
+import hashlib
+import logging
+import time
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+import redis.asyncio as redis
+from app.core.config import settings
+from app.services.llm_registry import DEFAULT_EMBEDDING_MODEL
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_INDEX_KEY = "emb_cache_index"
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache shared by ingestion and retrieval.
+
+    Keys are a SHA-256 of the model and exact text, so identical chunks are
+    reused across jobs and identical queries across calls. Vectors are stored
+    as raw float32 bytes (4 KB for mistral-embed instead of ~20 KB of JSON),
+    and an LRU index bounds the number of entries.
+    """
+
+    def __init__(
+        self,
+        ttl: int = settings.EMBEDDING_CACHE_TTL,
+        max_entries: int = settings.EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=False)
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def make_key(text: str, model: str = DEFAULT_EMBEDDING_MODEL) -> str:
+        digest = hashlib.sha256(f"{model}\x00{text}".encode()).hexdigest()
+        return f"emb_cache:{model}:{digest}"
+
+    async def get_many(self, texts: Sequence[str], model: str = DEFAULT_EMBEDDING_MODEL) -> List[Optional[List[float]]]:
+        """Returns a vector per text, or None where the text has not been embedded yet."""
+        if not texts:
+            return []
+        keys = [self.make_key(t, model) for t in texts]
+        try:
+            stored = await self.redis_client.mget(keys)
+            hit_keys = {k: time.time() for k, v in zip(keys, stored) if v is not None}
+            if hit_keys:
+                await self.redis_client.zadd(EMBEDDING_CACHE_INDEX_KEY, hit_keys)
+        except Exception as cache_err:
+            logger.warning(f"Embedding cache lookup failed: {cache_err}")
+            stored = [None] * len(keys)
+
+        vectors = [np.frombuffer(v, dtype=np.float32).tolist() if v is not None else None for v in stored]
+        hits = sum(v is not None for v in vectors)
+        self.stats["hits"] += hits
+        self.stats["misses"] += len(vectors) - hits
+        return vectors
+
+    async def set_many(
+        self, texts: Sequence[str], vectors: Sequence[Sequence[float]], model: str = DEFAULT_EMBEDDING_MODEL
+    ):
+        if not texts:
+            return
+        try:
+            now = time.time()
+            index = {}
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for text, vector in zip(texts, vectors):
+                    key = self.make_key(text, model)
+                    pipe.set(key, np.asarray(vector, dtype=np.float32).tobytes(), ex=self.ttl)
+                    index[key] = now
+                pipe.zadd(EMBEDDING_CACHE_INDEX_KEY, index)
+                await pipe.execute()
+            await self._evict()
+        except Exception as cache_err:
+            logger.warning(f"Embedding cache write failed: {cache_err}")
+
+    async def _evict(self):
+        """Drops least-recently-used entries beyond max_entries."""
+        overflow = await self.redis_client.zcard(EMBEDDING_CACHE_INDEX_KEY) - self.max_entries
+        if overflow <= 0:
+            return
+        evicted = await self.redis_client.zpopmin(EMBEDDING_CACHE_INDEX_KEY, overflow)
+        if evicted:
+            await self.redis_client.delete(*(key for key, _ in evicted))
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0}
+
+
+embedding_cache = EmbeddingCache()
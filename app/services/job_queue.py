@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+import redis.asyncio as redis
+from celery import group
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE_QUEUE = "interactive"
+BULK_QUEUE = "bulk"
+RESUME_QUEUE = "resume"
+JOB_QUEUES = (INTERACTIVE_QUEUE, BULK_QUEUE, RESUME_QUEUE)
+
+WAIT_SAMPLES = 200
+
+# Quota check and append in one step, so concurrent submissions can't both
+# pass the check. Returns {1, new backlog} or {0, current backlog} if rejected.
+# KEYS: user list, user set, user ring, backlog hash, depth counter
+# ARGV: user_id, max backlog, payload...
+_ENQUEUE_SCRIPT = """
+local count = #ARGV - 2
+local backlog = tonumber(redis.call('HGET', KEYS[4], ARGV[1]) or '0')
+if backlog + count > tonumber(ARGV[2]) then
+  return {0, backlog}
+end
+-- Pushed in slices: unpack() of thousands of values overflows the Lua stack
+for i = 3, #ARGV, 1000 do
+  redis.call('RPUSH', KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+end
+if redis.call('SADD', KEYS[2], ARGV[1]) == 1 then
+  redis.call('RPUSH', KEYS[3], ARGV[1])
+end
+redis.call('INCRBY', KEYS[5], count)
+return {1, redis.call('HINCRBY', KEYS[4], ARGV[1], count)}
+"""
+
+# Round-robin pop: take the next user off the ring, pop one of their jobs and
+# requeue the user at the back if they still have work.
+# KEYS: user ring, user set, backlog hash, depth counter; ARGV: user list key prefix
+_POP_SCRIPT = """
+local user = redis.call('LPOP', KEYS[1])
+if not user then
+  return nil
+end
+local list_key = ARGV[1] .. user
+local payload = redis.call('LPOP', list_key)
+if redis.call('LLEN', list_key) > 0 then
+  redis.call('RPUSH', KEYS[1], user)
+else
+  redis.call('SREM', KEYS[2], user)
+end
+if not payload then
+  return nil
+end
+if redis.call('HINCRBY', KEYS[3], user, -1) <= 0 then
+  redis.call('HDEL', KEYS[3], user)
+end
+redis.call('DECR', KEYS[4])
+return {user, payload}
+"""
+
+
+class QueueQuotaExceeded(Exception):
+    """Raised when a tenant's queued jobs would exceed its quota for a queue."""
+
+    def __init__(self, backlog: int, retry_after: int):
+        super().__init__(f"Job backlog of {backlog} exceeds the per-user quota")
+        self.backlog = backlog
+        self.retry_after = retry_after
+
+
+class FairJobQueue:
+    """
+    Per-user fair-share scheduling on top of the Celery queues.
+
+    Submitting a job appends it to the user's list for a queue (interactive,
+    bulk or resume) and publishes an anonymous slot message on the matching
+    Celery queue. When a worker runs a slot it takes the next job round-robin
+    across users, so a tenant with hundreds of queued URLs gets one turn per
+    cycle like everyone else instead of draining the queue first.
+    """
+
+    def __init__(self):
+        # Bulk catalog runs legitimately queue thousands of URLs; interactive use doesn't
+        self.max_backlog_per_user = {
+            INTERACTIVE_QUEUE: settings.JOB_QUEUE_MAX_BACKLOG_PER_USER,
+            BULK_QUEUE: settings.JOB_QUEUE_MAX_BULK_BACKLOG_PER_USER,
+            RESUME_QUEUE: settings.JOB_QUEUE_MAX_BACKLOG_PER_USER,
+        }
+        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+    @staticmethod
+    def _keys(queue: str) -> Dict[str, str]:
+        return {
+            "user_list": f"fair:{queue}:user:",
+            "users": f"fair:{queue}:users",
+            "ring": f"fair:{queue}:ring",
+            "depth": f"fair:{queue}:depth",
+            "backlog": f"fair:{queue}:backlog",
+            "waits": f"fair:{queue}:waits",
+        }
+
+    async def admit(self, user_id: str, queue: str = INTERACTIVE_QUEUE, count: int = 1):
+        """
+        Raises QueueQuotaExceeded when `count` more jobs would exceed the
+        user's quota for the queue. A cheap pre-check that saves creating
+        jobs that can't be queued; enqueue_many enforces the quota atomically.
+        """
+        backlog = int(await self.redis_client.hget(self._keys(queue)["backlog"], user_id) or 0)
+        if backlog + count <= self.max_backlog_per_user[queue]:
+            return
+        raise QueueQuotaExceeded(backlog, await self._retry_after(queue))
+
+    async def _retry_after(self, queue: str) -> int:
+        # By the time a queued job's typical wait has passed, a slot should have freed up
+        waits = [float(w) for w in await self.redis_client.lrange(self._keys(queue)["waits"], 0, -1)]
+        avg_wait = sum(waits) / len(waits) if waits else 0.0
+        return max(settings.JOB_QUEUE_MIN_RETRY_AFTER, math.ceil(avg_wait))
+
+    async def enqueue(self, queue: str, user_id: str, job_id: str, product_url: str, resume: bool = False):
+        """Adds the job to the user's fair-share list and publishes a Celery slot for it."""
+        await self.enqueue_many(queue, user_id, [(job_id, product_url)], resume=resume)
+
+    async def enqueue_many(
+        self, queue: str, user_id: str, jobs: Sequence[Tuple[str, str]], resume: bool = False
+    ):
+        """
+        Adds (job_id, product_url) pairs to the user's list in one script call
+        and publishes their slots as a single Celery group. The broker publish
+        is blocking I/O, so it runs in a thread off the event loop.
+
+        Raises QueueQuotaExceeded, queueing none of the jobs, when they would
+        take the user past the queue's quota.
+        """
+        if not jobs:
+            return
+        # Imported here: the worker module imports this one
+        from app.workers.celery_worker import run_next_job_task
+
+        keys = self._keys(queue)
+        enqueued_at = time.time()
+        payloads = [
+            json.dumps({"job_id": job_id, "product_url": product_url, "resume": resume, "enqueued_at": enqueued_at})
+            for job_id, product_url in jobs
+        ]
+        accepted, backlog = await self.redis_client.eval(
+            _ENQUEUE_SCRIPT, 5,
+            keys["user_list"] + user_id, keys["users"], keys["ring"], keys["backlog"], keys["depth"],
+            user_id, self.max_backlog_per_user[queue], *payloads,
+        )
+        if not accepted:
+            raise QueueQuotaExceeded(int(backlog), await self._retry_after(queue))
+        if len(jobs) == 1:
+            await asyncio.to_thread(run_next_job_task.apply_async, args=[queue], queue=queue)
+        else:
+            await asyncio.to_thread(group(run_next_job_task.si(queue).set(queue=queue) for _ in jobs).apply_async)
+
+    async def pop(self, queue: str) -> Optional[Dict[str, Any]]:
+        """Takes the next job for the queue, rotating across users, and records its wait time."""
+        keys = self._keys(queue)
+        popped = await self.redis_client.eval(
+            _POP_SCRIPT, 4, keys["ring"], keys["users"], keys["backlog"], keys["depth"], keys["user_list"],
+        )
+        if not popped:
+            return None
+        user_id, payload = popped
+        job = json.loads(payload)
+        job["user_id"] = user_id
+        wait = time.time() - job["enqueued_at"]
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.lpush(keys["waits"], round(wait, 3))
+                pipe.ltrim(keys["waits"], 0, WAIT_SAMPLES - 1)
+                await pipe.execute()
+        except Exception as stats_err:
+            logger.warning(f"Queue wait metric failed: {stats_err}")
+        logger.info(f"--- QUEUE {queue}: Job {job['job_id']} for user {user_id} waited {wait:.1f}s ---")
+        return job
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Depth, per-user backlogs and recent wait times per queue."""
+        stats: Dict[str, Any] = {}
+        for queue in JOB_QUEUES:
+            keys = self._keys(queue)
+            waits = sorted(float(w) for w in await self.redis_client.lrange(keys["waits"], 0, -1))
+            stats[queue] = {
+                "depth": int(await self.redis_client.get(keys["depth"]) or 0),
+                "active_users": await self.redis_client.scard(keys["users"]),
+                "user_backlogs": {
+                    user: int(n) for user, n in (await self.redis_client.hgetall(keys["backlog"])).items()
+                },
+                "wait_avg_sec": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "wait_p95_sec": waits[max(0, math.ceil(len(waits) * 0.95) - 1)] if waits else 0.0,
+                "wait_max_sec": waits[-1] if waits else 0.0,
+            }
+        return {"queues": stats}
+
+
+job_queue = FairJobQueue()
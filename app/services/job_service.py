@@ -1,77 +1,208 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import and_, text
-from app.models.job_models import Job
+from sqlalchemy import func, literal_column, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.models.job_models import Job, JobBatchMember, ACTIVE_JOB_PREDICATE
+import uuid
 from uuid import UUID
+from typing import List, Optional, Sequence, Tuple
 from datetime import datetime, timedelta
+from app.core.config import settings
+from app.services.checkpointer import checkpointer_registry
+from app.agents.orchestrator import get_app_workflow
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def create_job(db: AsyncSession, product_url: str) -> Job:
-    """Initializes job with 30-minute idempotency check."""
-    recent_threshold = datetime.utcnow() - timedelta(minutes=30)
-    existing_job_query = await db.execute(
-        select(Job).filter(
-            and_(
-                Job.product_url == product_url,
-                Job.status.in_(["pending", "started"]),
-                Job.created_at > recent_threshold
-            )
+async def create_job(db: AsyncSession, product_url: str) -> Tuple[Job, bool]:
+    """
+    Initializes job with an idempotency check on active jobs for the URL.
+    Returns (job, created); created is False when an active job was reused.
+
+    The INSERT arbitrates on the partial unique index over active jobs, so
+    concurrent submissions for a URL resolve to a single row. An abandoned
+    active job is failed first and replaced by a fresh row.
+    """
+    now = datetime.utcnow()
+    await _fail_stale_jobs(db, [product_url], now)
+    result = await db.execute(
+        _upsert_active_jobs([
+            {"id": uuid.uuid4(), "product_url": product_url, "status": "pending", "created_at": now, "updated_at": now}
+        ]),
+        execution_options={"populate_existing": True},
+    )
+    job, created = result.one()
+    await db.commit()
+    return job, created
+
+async def _fail_stale_jobs(db: AsyncSession, product_urls: Sequence[str], now: datetime):
+    """
+    Fails claimed jobs with no progress for JOB_STALE_AFTER. That exceeds
+    PIPELINE_TIMEOUT, so no worker can still be running them, and the
+    replacement gets a new id (and checkpoint thread) instead of resuming
+    the old state. Pending jobs are still waiting in the queue (a bulk
+    backlog can take hours), so they are never considered abandoned.
+    """
+    await db.execute(
+        update(Job)
+        .where(
+            Job.product_url.in_(product_urls),
+            text(ACTIVE_JOB_PREDICATE),
+            Job.status != "pending",
+            Job.updated_at <= now - timedelta(seconds=settings.JOB_STALE_AFTER),
         )
+        .values(status="failed", error_message="Abandoned: no progress before resubmission", updated_at=now)
+        .execution_options(synchronize_session=False)
     )
-    existing_job = existing_job_query.scalars().first()
-    
-    if existing_job:
-        return existing_job
 
-    job = Job(product_url=product_url, status="pending")
-    db.add(job)
+def _upsert_active_jobs(rows: List[dict]):
+    """
+    INSERT ... ON CONFLICT on the active-job index, returning (Job, inserted)
+    per row; inserted comes from xmax, which is 0 only for a new tuple.
+    """
+    stmt = pg_insert(Job).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[Job.product_url],
+        # Literal predicate so Postgres can match it to the partial index
+        index_where=text(ACTIVE_JOB_PREDICATE),
+        # No-op DO UPDATE (not DO NOTHING) so the existing row is locked and returned
+        set_={"product_url": stmt.excluded.product_url},
+    ).returning(Job, literal_column("(xmax = 0)").label("inserted"))
+
+async def create_jobs_bulk(
+    db: AsyncSession,
+    product_urls: Sequence[str],
+    batch_id: UUID,
+    insert_batch_size: int = settings.BULK_INSERT_BATCH_SIZE,
+) -> Tuple[List[Job], List[Job]]:
+    """
+    Creates jobs for already-deduplicated URLs with multi-row upserts in one
+    transaction. Returns (created, reused): URLs with a live active job
+    reuse it instead of getting a new row. Both are added to the batch.
+    """
+    now = datetime.utcnow()
+    created: List[Job] = []
+    reused: List[Job] = []
+    # Chunked so each statement stays well under Postgres' 32767 bind parameter limit
+    for i in range(0, len(product_urls), insert_batch_size):
+        rows = [
+            {"id": uuid.uuid4(), "product_url": url, "status": "pending", "created_at": now, "updated_at": now}
+            for url in product_urls[i:i + insert_batch_size]
+        ]
+        await _fail_stale_jobs(db, [row["product_url"] for row in rows], now)
+        result = await db.execute(_upsert_active_jobs(rows), execution_options={"populate_existing": True})
+        jobs = result.all()
+        for job, inserted in jobs:
+            (created if inserted else reused).append(job)
+        if jobs:
+            await db.execute(
+                pg_insert(JobBatchMember)
+                .values([{"batch_id": batch_id, "job_id": job.id} for job, _ in jobs])
+                .on_conflict_do_nothing()
+            )
     await db.commit()
-    await db.refresh(job)
-    return job
+    return created, reused
+
+async def get_batch_progress(db: AsyncSession, batch_id: UUID) -> Optional[dict]:
+    """Aggregates a bulk batch's job statuses in one GROUP BY; None if the batch is unknown."""
+    result = await db.execute(
+        select(Job.status, func.count())
+        .join(JobBatchMember, JobBatchMember.job_id == Job.id)
+        .where(JobBatchMember.batch_id == batch_id)
+        .group_by(Job.status)
+    )
+    by_status = {status: count for status, count in result.all()}
+    if not by_status:
+        return None
+    total = sum(by_status.values())
+    finished = by_status.get("completed", 0) + by_status.get("failed", 0)
+    return {
+        "batch_id": batch_id,
+        "total": total,
+        "completed": by_status.get("completed", 0),
+        "failed": by_status.get("failed", 0),
+        "in_progress": total - finished,
+        "percent_complete": round(finished / total * 100, 1),
+        "by_status": by_status,
+    }
 
 async def update_job_status(db: AsyncSession, job_id: str, status: str, error: str = None):
-    """Atomic status updates for worker reporting."""
-    result = await db.execute(select(Job).filter(Job.id == job_id))
-    job = result.scalars().first()
-    if job:
-        job.status = status
-        if error:
-            job.error_message = error
-        await db.commit()
+    """Atomic status updates for worker reporting: a single UPDATE, no prior SELECT."""
+    values = {"status": status, "updated_at": datetime.utcnow()}
+    if error:
+        values["error_message"] = error
+    await db.execute(update(Job).where(Job.id == UUID(str(job_id))).values(**values))
+    await db.commit()
+
+async def fail_jobs(db: AsyncSession, job_ids: Sequence[UUID], error: str):
+    """Marks jobs failed in one UPDATE, e.g. when they could not be queued."""
+    if not job_ids:
+        return
+    await db.execute(
+        update(Job)
+        .where(Job.id.in_(job_ids))
+        .values(status="failed", error_message=error, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
 
 async def get_job(db: AsyncSession, job_id: UUID) -> Job:
     """Retrieves job metadata."""
     result = await db.execute(select(Job).filter(Job.id == job_id))
     return result.scalars().first()
 
-async def is_job_resumable(db: AsyncSession, job_id: str) -> bool:
-    """Checks if LangGraph checkpoints exist in Postgres."""
-    query = text("SELECT 1 FROM checkpoints WHERE thread_id = :job_id LIMIT 1")
-    result = await db.execute(query, {"job_id": job_id})
-    exists = result.fetchone() is not None
-    return exists
+async def is_job_resumable(job_id: str) -> bool:
+    """
+    Checks that the job's thread stopped partway: its latest checkpoint
+    still has nodes to run. A finished thread keeps its final checkpoint,
+    and resuming that would run nothing.
+    """
+    app_workflow = await get_app_workflow()
+    snapshot = await app_workflow.aget_state({"configurable": {"thread_id": str(job_id)}})
+    return bool(snapshot.next)
 
-async def reset_job_for_retry(db: AsyncSession, job_id: str):
-    """Prepares database for a worker retry."""
-    result = await db.execute(select(Job).filter(Job.id == job_id))
-    job = result.scalars().first()
-    if job:
-        job.status = "pending"
-        job.error_message = None
+async def reset_job_for_retry(db: AsyncSession, job_id: str) -> bool:
+    """
+    Prepares a failed job for a worker retry in a single UPDATE. Returns
+    False if the job isn't failed (completed, or still queued or running)
+    or another active job already exists for the URL (the partial unique
+    index rejects a second one).
+    """
+    try:
+        result = await db.execute(
+            update(Job)
+            .where(Job.id == UUID(str(job_id)), Job.status == "failed")
+            .values(status="pending", error_message=None, updated_at=datetime.utcnow())
+            .returning(Job.id)
+            .execution_options(synchronize_session=False)
+        )
+        reset = result.first() is not None
         await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return False
+    return reset
+
+async def claim_job(db: AsyncSession, job_id: str) -> bool:
+    """
+    Marks a queued job as started, unless it stopped being active while
+    queued (e.g. failed as abandoned and replaced by a newer job).
+    """
+    result = await db.execute(
+        update(Job)
+        .where(Job.id == UUID(str(job_id)), text(ACTIVE_JOB_PREDICATE))
+        .values(status="started", updated_at=datetime.utcnow())
+        .returning(Job.id)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.first() is not None
 
-async def get_latest_state(db: AsyncSession, job_id: str):
+async def get_latest_state(job_id: str):
     """
-    Retrieves the most recent status from the checkpoints to 
+    Retrieves the most recent state from the checkpoints to 
     sync the main 'jobs' table if a worker died silently.
     """
-    query = text("""
-        SELECT checkpoint FROM checkpoints 
-        WHERE thread_id = :job_id 
-        ORDER BY created_at DESC LIMIT 1
-    """)
-    result = await db.execute(query, {"job_id": job_id})
-    row = result.fetchone()
-    return row[0] if row else None
\ No newline at end of file
+    latest = await checkpointer_registry.get_latest(job_id)
+    return latest.checkpoint["channel_values"] if latest else None
@@ -1,76 +1,164 @@
+import asyncio
+import logging
+import time
 import uuid
-from typing import List
-from langchain_mistralai import MistralAIEmbeddings
-from app.db.session import SessionLocal
+from typing import Any, Dict, List, Optional
+from sqlalchemy import insert, select, text
+from app.db.session import AsyncSessionLocal
 from app.models.vector_models import ProductEmbedding
 from app.core.config import settings
-from sqlalchemy import func
+from app.services.embedding_cache import embedding_cache
+from app.services.llm_registry import get_embeddings
+from app.services.rate_limiter import llm_rate_limiter
+
+logger = logging.getLogger(__name__)
+
 
 class KnowledgeService:
-    def __init__(self):
-        # Initializing Mistral Embeddings (aligned with 1024 dimensions)
-        self.embeddings = MistralAIEmbeddings(
-            api_key=settings.MISTRAL_API_KEY,
-            model="mistral-embed"
-        )
-
-    def chunk_text(self, text: str, chunk_size: int = 500) -> List[str]:
+    def __init__(
+        self,
+        embed_batch_size: int = settings.KB_EMBED_BATCH_SIZE,
+        embed_concurrency: int = settings.KB_EMBED_CONCURRENCY,
+        insert_batch_size: int = settings.KB_INSERT_BATCH_SIZE,
+    ):
+        # Mistral 'mistral-embed' (1024 dimensions) comes from the shared registry per event loop
+        self.embed_batch_size = embed_batch_size
+        self.embed_concurrency = embed_concurrency
+        self.insert_batch_size = insert_batch_size
+
+    def chunk_text(self, text: str, chunk_size: int = settings.KB_CHUNK_SIZE) -> List[str]:
         """Simple character-based chunking for research data."""
         return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
 
+    async def _embed_batches(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds texts with one aembed_documents call per batch, running at most
+        embed_concurrency batches at once. Output order matches input order.
+        """
+        embeddings = get_embeddings()
+        semaphore = asyncio.Semaphore(self.embed_concurrency)
+        batches = [texts[i:i+self.embed_batch_size] for i in range(0, len(texts), self.embed_batch_size)]
+
+        async def embed_batch(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                # Embedding calls draw from the same Mistral budget as chat calls
+                await llm_rate_limiter.acquire(llm_rate_limiter.estimate_tokens("".join(batch)))
+                return await embeddings.aembed_documents(batch)
+
+        results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+    async def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds texts through the shared embedding cache: only distinct texts
+        that no earlier job or query has embedded are sent to Mistral.
+        mistral-embed has no query/document distinction, so chunk and query
+        vectors are interchangeable.
+        """
+        unique = list(dict.fromkeys(texts))
+        cached = await embedding_cache.get_many(unique)
+        vectors = dict(zip(unique, cached))
+
+        missing = [t for t in unique if vectors[t] is None]
+        if missing:
+            fresh = await self._embed_batches(missing)
+            vectors.update(zip(missing, fresh))
+            await embedding_cache.set_many(missing, fresh)
+
+        return [vectors[t] for t in texts]
+
     async def add_research_to_kb(self, job_id: str, raw_text: str):
-        """Processes raw research data: chunks it, embeds it, and saves to pgvector."""
-        db = SessionLocal()
+        """Processes raw research data: chunks it, embeds it in batches, and bulk-inserts into pgvector."""
         chunks = self.chunk_text(raw_text)
+        if not chunks:
+            return
+
+        start_time = time.perf_counter()
         try:
-            for chunk in chunks:
-                vector = await self.embeddings.aembed_query(chunk)
-                embedding_entry = ProductEmbedding(
-                    job_id=uuid.UUID(job_id),
-                    embedding=vector,
-                    content=chunk,
-                    payload_metadata={"source": "tavily_research"}
-                )
-                db.add(embedding_entry)
-            db.commit()
-            print(f"--- KNOWLEDGE BASE: Processed {len(chunks)} chunks for Job {job_id} ---")
+            # 1. Batched embedding, reusing vectors for chunks seen before
+            vectors = await self._embed_texts(chunks)
+            embed_latency = time.perf_counter() - start_time
+
+            # 2. Multi-row INSERT, one statement per insert batch, single transaction
+            rows: List[Dict[str, Any]] = [
+                {
+                    "id": uuid.uuid4(),
+                    "job_id": uuid.UUID(job_id),
+                    "embedding": vector,
+                    "content": chunk,
+                    "payload_metadata": {"source": "tavily_research"},
+                }
+                for chunk, vector in zip(chunks, vectors)
+            ]
+            insert_start = time.perf_counter()
+            async with AsyncSessionLocal() as db:
+                for i in range(0, len(rows), self.insert_batch_size):
+                    await db.execute(insert(ProductEmbedding).values(rows[i:i+self.insert_batch_size]))
+                await db.commit()
+            insert_latency = time.perf_counter() - insert_start
+
+            # 3. Throughput metrics
+            total = time.perf_counter() - start_time
+            logger.info(
+                f"--- KNOWLEDGE BASE: Processed {len(chunks)} chunks for Job {job_id} "
+                f"({len(chunks) / total:.1f} chunks/s, embed {embed_latency:.2f}s, "
+                f"insert {insert_latency:.2f}s) ---"
+            )
         except Exception as e:
-            print(f"--- KB ERROR: {str(e)} ---")
-            db.rollback()
-        finally:
-            db.close()
-
-    
-
-    async def query_knowledge_base(self, job_id: str, query: str, top_k: int = 5) -> str:
-    db = SessionLocal()
-    try:
-        query_vector = await self.embeddings.aembed_query(query)
-        
+            logger.error(f"--- KB ERROR: {str(e)} ---")
+
+    async def query_knowledge_base(
+        self,
+        job_id: str,
+        query: str,
+        top_k: int = 5,
+        ef_search: Optional[int] = None,
+        max_distance: float = settings.KB_MAX_DISTANCE,
+    ) -> str:
+        """
+        Returns the top_k chunks for a job closest to the query by cosine distance.
+        ef_search trades recall for latency on the HNSW index (higher = better recall).
+
+        The index is global across jobs, so the job_id filter is applied to
+        the candidates it returns. On pgvector >= 0.8, enabling
+        KB_HNSW_ITERATIVE_SCAN keeps walking the graph until top_k rows pass
+        the filter; without it a job whose vectors are outnumbered by other
+        jobs' could get fewer rows, or none.
+        """
+        query_vector = (await self._embed_texts([query]))[0]
+        distance = ProductEmbedding.embedding.cosine_distance(query_vector).label("distance")
+
+        async with AsyncSessionLocal() as db:
+            # Scoped to this transaction, so pooled connections keep the default.
+            # The candidate list can never be shorter than the rows asked for.
+            ef_search = max(int(ef_search or settings.KB_HNSW_EF_SEARCH), top_k)
+            await db.execute(text(f"SET LOCAL hnsw.ef_search = {ef_search}"))
+            if settings.KB_HNSW_ITERATIVE_SCAN != "off":
+                await db.execute(text(f"SET LOCAL hnsw.iterative_scan = {settings.KB_HNSW_ITERATIVE_SCAN}"))
+
+            # Distance is computed once and ordered on, which keeps the query
+            # eligible for the index; the threshold is applied to the returned rows
+            results = await db.execute(
+                select(ProductEmbedding.content, distance)
+                .where(ProductEmbedding.job_id == uuid.UUID(job_id))
+                .order_by(distance)
+                .limit(top_k)
+            )
+            rows = results.all()
+
         # Hardened Retrieval with Distance Threshold
-        # Only return chunks with a cosine distance less than 0.4 (high similarity)
-        results = db.query(ProductEmbedding).filter(
-            ProductEmbedding.job_id == uuid.UUID(job_id),
-            ProductEmbedding.embedding.cosine_distance(query_vector) < 0.4 
-        ).order_by(
-            ProductEmbedding.embedding.cosine_distance(query_vector)
-        ).limit(top_k).all()
-        
-        if not results:
+        # Only return chunks with a cosine distance less than max_distance (high similarity)
+        contents = [row.content for row in rows if row.distance < max_distance]
+        if not contents:
             return "No highly relevant research data found."
 
-        return "\n\n".join([r.content for r in results])
-    finally:
-        db.close()
+        return "\n\n".join(contents)
 
-    # app/services/knowledge_service.py (Add this method)
     async def get_raw_context_for_eval(self, job_id: str, query: str) -> str:
-    """
-    Retrieves the top-k document chunks specifically for quality auditing.
-    """
-    # This logic should match your vector search implementation
-        results = await self.vector_store.similarity_search(query, k=3, filter={"job_id": job_id})
-        return "\n".join([doc.page_content for doc in results])
+        """
+        Retrieves the top-k document chunks specifically for quality auditing.
+        """
+        return await self.query_knowledge_base(job_id, query, top_k=3)
 
 # Export a singleton instance
-kb_service = KnowledgeService()
\ No newline at end of file
+kb_service = KnowledgeService()
@@ -0,0 +1,285 @@
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+import redis.asyncio as redis
+from langchain_core.utils.json import parse_partial_json
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.vector_models import LLMCacheVector
+from app.services.llm_registry import DEFAULT_MODEL, get_embeddings, get_llm
+from app.services.rate_limiter import llm_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_INDEX_KEY = "llm_cache_index"
+
+
+def _normalize_prompt(prompt: Any) -> List[Tuple[str, str]]:
+    """Reduces a prompt (string or message list) to (role, whitespace-collapsed text) pairs."""
+    messages = prompt if isinstance(prompt, list) else [prompt]
+    normalized = []
+    for message in messages:
+        role = getattr(message, "type", "human")
+        content = getattr(message, "content", message)
+        normalized.append((role, " ".join(str(content).split())))
+    return normalized
+
+
+class LLMResponseCache:
+    """
+    Response cache for deterministic (temperature=0) structured-output calls.
+
+    Entries are keyed on a SHA-256 of the model, normalized prompt messages and
+    the output schema's JSON schema, so editing a schema invalidates its
+    entries. An LRU index bounds the number of entries. With semantic lookup
+    enabled, near-duplicate prompts are matched by embedding similarity in
+    pgvector, but only among prompts with the same scope (the job inputs,
+    e.g. the product URL): prompts that differ only in the product are near
+    duplicates too, and must never share a response. Calls without a scope
+    only get exact hits.
+    A hit refreshes the entry's TTL, so an index score older than the TTL
+    means the response has expired and its index and vector entries can go.
+    """
+
+    def __init__(
+        self,
+        ttl: int = settings.LLM_CACHE_TTL,
+        max_entries: int = settings.LLM_CACHE_MAX_ENTRIES,
+        semantic: bool = settings.LLM_CACHE_SEMANTIC,
+        similarity_threshold: float = settings.LLM_CACHE_SIMILARITY_THRESHOLD,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.similarity_threshold = similarity_threshold
+        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0}
+
+    @staticmethod
+    def _namespace(model: str, schema: Type[BaseModel]) -> str:
+        return f"{model}:{schema.__name__}"
+
+    def _semantic_namespace(self, model: str, schema: Type[BaseModel], scope: str) -> str:
+        return f"{self._namespace(model, schema)}:{hashlib.sha256(scope.encode()).hexdigest()}"
+
+    def make_key(self, model: str, prompt: Any, schema: Type[BaseModel]) -> str:
+        payload = json.dumps(
+            {
+                "model": model,
+                "messages": _normalize_prompt(prompt),
+                "schema": schema.model_json_schema(),
+            },
+            sort_keys=True,
+        )
+        digest = hashlib.sha256(payload.encode()).hexdigest()
+        return f"llm_cache:{self._namespace(model, schema)}:{digest}"
+
+    async def _embed(self, prompt: Any) -> List[float]:
+        text = "\n".join(content for _, content in _normalize_prompt(prompt))
+        return await get_embeddings().aembed_query(text)
+
+    async def _semantic_lookup(self, namespace: str, vector: List[float]) -> Optional[str]:
+        # The namespace index narrows the candidates to one scope's handful of
+        # prompts; distances are then exact over those rows
+        distance = LLMCacheVector.embedding.cosine_distance(vector)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(LLMCacheVector.key, distance.label("distance"))
+                .where(LLMCacheVector.namespace == namespace)
+                .order_by(distance)
+                .limit(1)
+            )
+            best = result.first()
+        return best.key if best and 1 - best.distance >= self.similarity_threshold else None
+
+    async def get(
+        self, model: str, prompt: Any, schema: Type[BaseModel], scope: Optional[str] = None
+    ) -> Tuple[Optional[BaseModel], str]:
+        """Returns (parsed response, 'hit' | 'semantic_hit' | 'miss')."""
+        try:
+            key = self.make_key(model, prompt, schema)
+            cached = await self.redis_client.get(key)
+            status = "hit"
+
+            if cached is None and self.semantic and scope:
+                similar_key = await self._semantic_lookup(
+                    self._semantic_namespace(model, schema, scope), await self._embed(prompt)
+                )
+                if similar_key:
+                    key, cached, status = similar_key, await self.redis_client.get(similar_key), "semantic_hit"
+                    if cached is None:
+                        # Expired since the last prune: stop matching against it
+                        await self._drop([similar_key])
+
+            if cached is not None:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    pipe.expire(key, self.ttl)
+                    pipe.zadd(LLM_CACHE_INDEX_KEY, {key: time.time()})
+                    await pipe.execute()
+                self.stats[status + "s"] += 1
+                return schema.model_validate_json(cached), status
+        except Exception as cache_err:
+            logger.warning(f"LLM cache lookup failed: {cache_err}")
+
+        self.stats["misses"] += 1
+        return None, "miss"
+
+    async def set(
+        self, model: str, prompt: Any, schema: Type[BaseModel], parsed: BaseModel, scope: Optional[str] = None
+    ):
+        try:
+            key = self.make_key(model, prompt, schema)
+            await self.redis_client.set(key, parsed.model_dump_json(), ex=self.ttl)
+            await self.redis_client.zadd(LLM_CACHE_INDEX_KEY, {key: time.time()})
+            if self.semantic and scope:
+                row = {
+                    "key": key,
+                    "namespace": self._semantic_namespace(model, schema, scope),
+                    "embedding": await self._embed(prompt),
+                }
+                stmt = pg_insert(LLMCacheVector).values(row)
+                async with AsyncSessionLocal() as db:
+                    await db.execute(stmt.on_conflict_do_update(
+                        index_elements=[LLMCacheVector.key],
+                        set_={"namespace": stmt.excluded.namespace, "embedding": stmt.excluded.embedding},
+                    ))
+                    await db.commit()
+            await self._evict()
+        except Exception as cache_err:
+            logger.warning(f"LLM cache write failed: {cache_err}")
+
+    async def _evict(self):
+        """Drops expired entries, then least-recently-used entries beyond max_entries."""
+        expired = await self.redis_client.zrangebyscore(LLM_CACHE_INDEX_KEY, "-inf", time.time() - self.ttl)
+        await self._drop(expired)
+        overflow = await self.redis_client.zcard(LLM_CACHE_INDEX_KEY) - self.max_entries
+        if overflow > 0:
+            evicted = await self.redis_client.zpopmin(LLM_CACHE_INDEX_KEY, overflow)
+            await self._drop([key for key, _ in evicted])
+
+    async def _drop(self, keys: List[str]):
+        """Removes entries from the response keys, the LRU index and the vector table."""
+        if not keys:
+            return
+        await self.redis_client.delete(*keys)
+        await self.redis_client.zrem(LLM_CACHE_INDEX_KEY, *keys)
+        if self.semantic:
+            async with AsyncSessionLocal() as db:
+                await db.execute(delete(LLMCacheVector).where(LLMCacheVector.key.in_(keys)))
+                await db.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        hits = self.stats["hits"] + self.stats["semantic_hits"]
+        return {**self.stats, "hit_rate": round(hits / lookups, 3) if lookups else 0.0}
+
+
+llm_cache = LLMResponseCache()
+
+
+async def invoke_structured(
+    schema: Type[BaseModel], prompt: Any, model: str = DEFAULT_MODEL, scope: Optional[str] = None
+) -> Tuple[Dict[str, Any], float, str]:
+    """
+    Cached, rate-limited structured-output call; scope (the job inputs, e.g.
+    the product URL) enables semantic matching among prompts for it.
+    Returns ({'parsed', 'raw'}, queue wait seconds, cache status). On a hit
+    'raw' is None, so track_telemetry records zero tokens and cost.
+    """
+    parsed, cache_status = await llm_cache.get(model, prompt, schema, scope)
+    if parsed is not None:
+        return {"parsed": parsed, "raw": None}, 0.0, cache_status
+
+    result, queue_wait = await llm_rate_limiter.invoke(get_llm(schema, model=model), prompt)
+    if result.get("parsed") is not None:
+        await llm_cache.set(model, prompt, schema, result["parsed"], scope)
+    return result, queue_wait, cache_status
+
+
+def _json_mode_prompt(prompt: Any, schema: Type[BaseModel]) -> Any:
+    """Appends the schema so JSON mode returns an object the schema can validate."""
+    instruction = (
+        "Respond only with a JSON object that matches this JSON schema:\n"
+        f"{json.dumps(schema.model_json_schema())}"
+    )
+    if isinstance(prompt, list):
+        return [*prompt, ("human", instruction)]
+    return f"{prompt}\n\n{instruction}"
+
+
+async def stream_structured(
+    schema: Type[BaseModel],
+    prompt: Any,
+    render: Callable[[Dict[str, Any]], str],
+    on_text: Callable[[str], Awaitable[None]],
+    model: str = DEFAULT_MODEL,
+    on_reset: Optional[Callable[[], Awaitable[None]]] = None,
+    scope: Optional[str] = None,
+) -> Tuple[Dict[str, Any], float, str]:
+    """
+    Streaming counterpart of invoke_structured with the same return value
+    and cache scope.
+
+    The model answers in JSON mode and the accumulated tokens are parsed as
+    partial JSON at most every STREAM_TOKEN_EMIT_INTERVAL; render turns the
+    (partial) object into display text and on_text receives each newly
+    rendered piece. A cache hit is emitted as one piece. If the streamed
+    JSON fails validation, the call falls back to a regular structured-output
+    request: on_reset is called to retract the text already emitted and the
+    fallback result is emitted as one piece.
+    """
+    parsed, cache_status = await llm_cache.get(model, prompt, schema, scope)
+    if parsed is not None:
+        await on_text(render(parsed.model_dump()))
+        return {"parsed": parsed, "raw": None}, 0.0, cache_status
+
+    emitted = ""
+    last_emit = 0.0
+
+    async def emit(content: Any):
+        nonlocal emitted
+        partial = parse_partial_json(content) if isinstance(content, str) else None
+        if not isinstance(partial, dict):
+            return
+        text = render(partial)
+        # Partial parsing can revise the tail (e.g. an escape sequence); only emit clean extensions
+        if len(text) > len(emitted) and text.startswith(emitted):
+            delta, emitted = text[len(emitted):], text
+            await on_text(delta)
+
+    async def on_chunk(message: Any):
+        nonlocal last_emit
+        # Reparsing the whole message and publishing per chunk is quadratic; sample instead
+        now = time.monotonic()
+        if now - last_emit < settings.STREAM_TOKEN_EMIT_INTERVAL:
+            return
+        last_emit = now
+        await emit(message.content)
+
+    llm = get_llm(model=model).bind(response_format={"type": "json_object"})
+    raw, queue_wait = await llm_rate_limiter.stream(llm, _json_mode_prompt(prompt, schema), on_chunk)
+    parsed = None
+    try:
+        if raw is None or not isinstance(raw.content, str):
+            raise ValueError("stream returned no content")
+        parsed = schema.model_validate_json(raw.content)
+    except (ValidationError, ValueError) as validation_err:
+        logger.warning(f"Streamed {schema.__name__} failed validation, retrying unstreamed: {validation_err}")
+        if emitted and on_reset is not None:
+            await on_reset()
+        result, retry_wait = await llm_rate_limiter.invoke(get_llm(schema, model=model), prompt)
+        parsed, raw, queue_wait = result.get("parsed"), result.get("raw"), queue_wait + retry_wait
+        if parsed is not None:
+            await on_text(render(parsed.model_dump()))
+    else:
+        # Flush whatever arrived since the last sampled emit
+        await emit(raw.content)
+
+    if parsed is not None:
+        await llm_cache.set(model, prompt, schema, parsed, scope)
+    return {"parsed": parsed, "raw": raw}, queue_wait, cache_status
@@ -0,0 +1,124 @@
+import asyncio
+import weakref
+from typing import Any, Dict, Optional, Tuple, Type
+import httpx
+from pydantic import BaseModel
+from app.core.config import settings
+
+MISTRAL_BASE_URL = "https://api.mistral.ai/v1"
+DEFAULT_MODEL = "mistral-small-latest"
+DEFAULT_EMBEDDING_MODEL = "mistral-embed"
+
+
+class LLMRegistry:
+    """
+    Lazily builds and caches chat models keyed by (model, temperature, output schema).
+
+    Every model created on the same event loop shares one keep-alive
+    httpx.AsyncClient, so connection pooling and TLS handshakes are paid once
+    per worker instead of once per agent module (or per call). The Mistral
+    stack is only imported when the first model is requested.
+    """
+
+    def __init__(self):
+        self._http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._models: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple, Any]]" = weakref.WeakKeyDictionary()
+        self._sync_client: Optional[httpx.Client] = None
+
+    @staticmethod
+    def _headers() -> Dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Authorization": f"Bearer {settings.MISTRAL_API_KEY}",
+        }
+
+    def _async_client(self, loop: asyncio.AbstractEventLoop) -> httpx.AsyncClient:
+        client = self._http_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=MISTRAL_BASE_URL,
+                headers=self._headers(),
+                timeout=settings.LLM_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                    keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+                ),
+            )
+            self._http_clients[loop] = client
+        return client
+
+    def _client(self) -> httpx.Client:
+        # ChatMistralAI builds a sync client when none is given; share a single one
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(
+                base_url=MISTRAL_BASE_URL,
+                headers=self._headers(),
+                timeout=settings.LLM_TIMEOUT,
+            )
+        return self._sync_client
+
+    def get_llm(
+        self,
+        schema: Optional[Type[BaseModel]] = None,
+        model: str = DEFAULT_MODEL,
+        temperature: float = 0,
+    ) -> Any:
+        """
+        Returns the cached chat model for this event loop. With a schema, the
+        model is wrapped in with_structured_output(include_raw=True) so callers
+        get both the parsed object and the raw AIMessage for telemetry.
+        """
+        loop = asyncio.get_running_loop()
+        models = self._models.setdefault(loop, {})
+        key = (model, temperature, schema)
+        if key not in models:
+            from langchain_mistralai import ChatMistralAI
+
+            llm = ChatMistralAI(
+                model=model,
+                temperature=temperature,
+                api_key=settings.MISTRAL_API_KEY,
+                max_retries=5,
+                timeout=settings.LLM_TIMEOUT,
+                client=self._client(),
+                async_client=self._async_client(loop),
+            )
+            models[key] = llm.with_structured_output(schema, include_raw=True) if schema else llm
+        return models[key]
+
+    def get_embeddings(self, model: str = DEFAULT_EMBEDDING_MODEL) -> Any:
+        """Returns the cached embeddings client for this event loop."""
+        loop = asyncio.get_running_loop()
+        models = self._models.setdefault(loop, {})
+        key = ("embeddings", model)
+        if key not in models:
+            from langchain_mistralai import MistralAIEmbeddings
+
+            models[key] = MistralAIEmbeddings(
+                model=model,
+                api_key=settings.MISTRAL_API_KEY,
+                client=self._client(),
+                async_client=self._async_client(loop),
+            )
+        return models[key]
+
+    async def aclose(self):
+        """Closes the pooled HTTP client bound to the running loop."""
+        loop = asyncio.get_running_loop()
+        self._models.pop(loop, None)
+        client = self._http_clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+
+llm_registry = LLMRegistry()
+
+
+def get_llm(schema: Optional[Type[BaseModel]] = None, model: str = DEFAULT_MODEL, temperature: float = 0) -> Any:
+    return llm_registry.get_llm(schema, model=model, temperature=temperature)
+
+
+def get_embeddings(model: str = DEFAULT_EMBEDDING_MODEL) -> Any:
+    return llm_registry.get_embeddings(model=model)
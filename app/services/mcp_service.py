@@ -1,78 +1,377 @@
 import asyncio
+import hashlib
 import json
 import logging
-from typing import Any, Dict
+import os
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
 import redis.asyncio as redis
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 from app.core.config import settings
+from app.services.process_stats import ProcessStatsPublisher, read_process_stats
+from app.services.single_flight import single_flight
 
 logger = logging.getLogger(__name__)
 
 # Initialize Redis client for Performance Layer caching
 redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
-MCP_CACHE_EXPIRY = 600  # 10-minute cache for tool responses
+MCP_CACHE_EXPIRY = 600  # Default 10-minute cache for tool responses
+MCP_NEGATIVE_CACHE_EXPIRY = 30  # Short cache for failures so outages aren't hammered
+MCP_SINGLE_FLIGHT_TIMEOUT = 60  # Max time followers wait on a stalled leader
+MCP_POOL_STATS_KEY = "mcp_pool_stats"
+
+# Bump a tool's version when its server output changes to invalidate old entries
+MCP_TOOL_CACHE_CONFIG: Dict[str, Dict[str, Any]] = {
+    "get_competitor_prices": {"version": "1", "ttl": 900},
+    "analyze_product_reviews": {"version": "1", "ttl": 21600},
+    "get_stock_levels": {"version": "1", "ttl": 300},
+    "get_product_economics": {"version": "1", "ttl": 3600},
+}
+ERROR_PREFIXES = ("Error", "System Error")
+
+
+def make_cache_key(tool_name: str, arguments: Dict[str, Any]) -> str:
+    """
+    Content-addressed cache key: canonical JSON of the arguments hashed with
+    SHA-256, so every process derives the same key (unlike the salted hash()).
+    Nested and unhashable argument values are supported.
+    """
+    version = MCP_TOOL_CACHE_CONFIG.get(tool_name, {}).get("version", "0")
+    canonical = json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(canonical.encode()).hexdigest()
+    return f"mcp_cache:{tool_name}:v{version}:{digest}"
+
+
+class PooledMCPSession:
+    """
+    A long-lived MCP server subprocess with an initialized ClientSession.
+
+    stdio_client/ClientSession are anyio context managers that must be entered
+    and exited by the same task, so a dedicated owner task keeps them open
+    until the pool asks the session to close.
+    """
+
+    def __init__(self, client_filename: str):
+        self.client_filename = client_filename
+        self.session: Optional[ClientSession] = None
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+        self.in_flight = 0
+        self._closing = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run(ready))
+        await ready
+
+    async def _run(self, ready: asyncio.Future):
+        # Run as a module so the server can import the `app` package, and pass
+        # the worker's environment through so API keys reach the tools
+        module = self.client_filename.removesuffix(".py")
+        server_params = StdioServerParameters(
+            command=sys.executable,
+            args=["-m", f"app.mcp_clients.{module}"],
+            env=dict(os.environ)
+        )
+        try:
+            async with stdio_client(server_params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self.session = session
+                    ready.set_result(None)
+                    await self._closing.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.warning(f"--- MCP POOL: {self.client_filename} session died: {e} ---")
+        finally:
+            self.session = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def ping(self) -> bool:
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=5)
+            return True
+        except Exception:
+            return False
+
+    async def close(self):
+        self._closing.set()
+        if self._task and not self._task.done():
+            try:
+                await asyncio.wait_for(self._task, timeout=5)
+            except Exception:
+                self._task.cancel()
+
+
+class MCPSessionPool:
+    """
+    Per-worker pool of initialized MCP sessions keyed by client filename.
+    Avoids paying interpreter startup and session.initialize() on every tool call.
+
+    A ClientSession multiplexes requests by id, so sessions are shared:
+    each call goes to the least busy session of its server, and another
+    session is spawned (up to max_sessions_per_server) only once every
+    session has max_calls_per_session calls in flight.
+    """
+
+    def __init__(
+        self,
+        max_sessions_per_server: int = settings.MCP_POOL_MAX_SESSIONS_PER_SERVER,
+        max_calls_per_session: int = settings.MCP_POOL_MAX_CALLS_PER_SESSION,
+        idle_timeout: int = settings.MCP_POOL_IDLE_TIMEOUT,
+        health_check_interval: int = settings.MCP_POOL_HEALTH_CHECK_INTERVAL,
+    ):
+        self.max_sessions_per_server = max_sessions_per_server
+        self.max_calls_per_session = max_calls_per_session
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self._sessions: Dict[str, List[PooledMCPSession]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_pid: Optional[int] = None
+        self._reaper: Optional[asyncio.Task] = None
+        self._stats_publisher = ProcessStatsPublisher(MCP_POOL_STATS_KEY)
+        self.stats = {
+            "hits": 0,
+            "spawns": 0,
+            "restarts": 0,
+            "evictions": 0,
+            "failed_health_checks": 0,
+        }
+
+    def _bind_loop(self):
+        # Sessions and locks belong to the loop that created them; a new
+        # loop (e.g. a fresh Celery task loop) starts with an empty pool.
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        sessions = [pooled for pooled_sessions in self._sessions.values() for pooled in pooled_sessions]
+        if self._loop_pid == os.getpid():
+            if self._reaper is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._reaper.cancel)
+            if sessions:
+                self._release_sessions(self._loop, sessions)
+        # In a forked child the sessions are the parent's, which still owns them
+        self._sessions.clear()
+        self._locks.clear()
+        self._loop = loop
+        self._loop_pid = os.getpid()
+        self._reaper = loop.create_task(self._reap_idle())
+
+    @staticmethod
+    def _release_sessions(old_loop: asyncio.AbstractEventLoop, sessions: List[PooledMCPSession]):
+        """
+        Shuts down the sessions of a loop the pool is leaving. Their owner
+        tasks can only run on that loop, so the close is scheduled there.
+        """
+        async def close_sessions():
+            await asyncio.gather(*(pooled.close() for pooled in sessions), return_exceptions=True)
+
+        logger.info(f"--- MCP POOL: Event loop changed, closing {len(sessions)} sessions ---")
+        if old_loop.is_closed():
+            # Nothing can run there any more: the subprocess transports kill
+            # their servers when they are garbage collected
+            return
+        if old_loop.is_running():
+            asyncio.run_coroutine_threadsafe(close_sessions(), old_loop)
+        else:
+            threading.Thread(
+                target=old_loop.run_until_complete, args=(close_sessions(),), name="mcp-pool-release", daemon=True
+            ).start()
+
+    async def _reap_idle(self):
+        """Evicts idle sessions in the background so unused servers don't linger."""
+        while True:
+            await asyncio.sleep(max(1, self.idle_timeout / 2))
+            try:
+                await self._evict_idle()
+            except Exception as reap_err:
+                logger.warning(f"MCP pool idle eviction failed: {reap_err}")
+
+    async def _evict_idle(self):
+        now = time.monotonic()
+        for sessions in list(self._sessions.values()):
+            stale = [s for s in sessions if s.in_flight == 0 and now - s.last_used > self.idle_timeout]
+            for pooled in stale:
+                sessions.remove(pooled)
+                self.stats["evictions"] += 1
+                await pooled.close()
+
+    async def _discard(self, client_filename: str, pooled: PooledMCPSession):
+        sessions = self._sessions.get(client_filename, [])
+        if pooled in sessions:
+            sessions.remove(pooled)
+        await pooled.close()
+
+    async def _acquire(self, client_filename: str) -> PooledMCPSession:
+        sessions = self._sessions.setdefault(client_filename, [])
+        # One caller at a time picks or spawns, so a burst doesn't spawn a server per caller
+        async with self._locks.setdefault(client_filename, asyncio.Lock()):
+            for pooled in [s for s in sessions if not s.alive]:
+                # Crashed: replaced by a spawn below if needed
+                self.stats["restarts"] += 1
+                await self._discard(client_filename, pooled)
+
+            while sessions:
+                pooled = min(sessions, key=lambda s: s.in_flight)
+                if pooled.in_flight >= self.max_calls_per_session and len(sessions) < self.max_sessions_per_server:
+                    break
+                if time.monotonic() - pooled.last_checked > self.health_check_interval:
+                    if not await pooled.ping():
+                        self.stats["failed_health_checks"] += 1
+                        await self._discard(client_filename, pooled)
+                        continue
+                    pooled.last_checked = time.monotonic()
+                self.stats["hits"] += 1
+                return pooled
+
+            logger.info(f"--- MCP POOL: Spawning {client_filename} ---")
+            pooled = PooledMCPSession(client_filename)
+            await pooled.start()
+            sessions.append(pooled)
+            self.stats["spawns"] += 1
+            return pooled
+
+    @asynccontextmanager
+    async def session(self, client_filename: str):
+        """Yields a healthy session, shared with other concurrent callers."""
+        self._bind_loop()
+        pooled = await self._acquire(client_filename)
+        pooled.in_flight += 1
+        try:
+            yield pooled.session
+        except Exception:
+            # Broken pipe or crashed server: drop it so the next call respawns.
+            # A tool error on a healthy session leaves it to the other callers.
+            if not pooled.alive or not await pooled.ping():
+                self.stats["restarts"] += 1
+                await self._discard(client_filename, pooled)
+            raise
+        finally:
+            pooled.in_flight -= 1
+            pooled.last_used = time.monotonic()
+        await self._stats_publisher.publish(redis_client, self.get_stats)
+
+    async def close_all(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for sessions in self._sessions.values():
+            for pooled in sessions:
+                await pooled.close()
+        self._sessions.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["spawns"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            "sessions": {name: len(s) for name, s in self._sessions.items()},
+            "in_flight": {name: sum(p.in_flight for p in s) for name, s in self._sessions.items()},
+        }
+
+
+mcp_pool = MCPSessionPool()
+
+
+async def get_pool_stats() -> Dict[str, Any]:
+    """Returns pool stats published by every worker process."""
+    return await read_process_stats(redis_client, MCP_POOL_STATS_KEY)
+
 
 class MCPManager:
     """
-    The MCPManager serves as the central bridge between LangGraph agents 
+    The MCPManager serves as the central bridge between LangGraph agents
     and specialized tools with integrated Redis caching for performance.
     """
 
     @staticmethod
     async def call_tool(client_filename: str, tool_name: str, arguments: Dict[str, Any]) -> Any:
         """
-        Connects to a specific MCP server and executes a tool call with caching.
+        Executes a tool call on a pooled MCP session with caching.
         """
-        # 1. Performance Layer: Generate unique cache key based on tool and arguments
-        # Using sorted arguments to ensure identical calls produce the same key
-        arg_hash = hash(frozenset(sorted(arguments.items())))
-        cache_key = f"mcp_cache:{tool_name}:{arg_hash}"
+        # 1. Performance Layer: Content-addressed key, stable across workers and restarts
+        cache_key = make_cache_key(tool_name, arguments)
 
         # 2. Cache Lookup
+        cached = await MCPManager._load_cached(cache_key, tool_name)
+        if cached is not None:
+            return cached
+
+        # 3. Cache Miss: identical concurrent calls from any worker share one execution
+        content, _ = await single_flight.do(
+            cache_key,
+            load=lambda: MCPManager._load_cached(cache_key, tool_name),
+            compute=lambda: MCPManager._execute(client_filename, tool_name, arguments, cache_key),
+            lock_timeout=MCP_SINGLE_FLIGHT_TIMEOUT,
+        )
+        return content
+
+    @staticmethod
+    async def _load_cached(cache_key: str, tool_name: str) -> Optional[Any]:
         try:
             cached_data = await redis_client.get(cache_key)
             if cached_data:
                 logger.info(f"--- MCP CACHE HIT: {tool_name} ---")
-                return json.loads(cached_data)
+                cached = json.loads(cached_data)
+                return cached["error"] if isinstance(cached, dict) else cached
         except Exception as cache_err:
             logger.warning(f"MCP Cache lookup failed: {cache_err}")
+        return None
 
-        # 3. Cache Miss: Execute Subprocess
-        server_params = StdioServerParameters(
-            command="python",
-            args=[f"app/mcp_clients/{client_filename}"]
-        )
-        
+    @staticmethod
+    async def _execute(client_filename: str, tool_name: str, arguments: Dict[str, Any], cache_key: str) -> Any:
+        """Runs the tool on a pooled session, restarting once if it crashed, and caches the outcome."""
         try:
-            logger.info(f"--- MCP: Connecting to {client_filename} for tool '{tool_name}' ---")
-            
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    
-                    # Execute tool
-                    result = await session.call_tool(tool_name, arguments)
-                    
-                    # 4. Update Cache for future performance
-                    if result.content:
-                        await redis_client.set(
-                            cache_key, 
-                            json.dumps(result.content), 
-                            ex=MCP_CACHE_EXPIRY
-                        )
-                    
-                    return result.content
-                    
+            for attempt in range(2):
+                try:
+                    async with mcp_pool.session(client_filename) as session:
+                        result = await session.call_tool(tool_name, arguments)
+                    break
+                except Exception as session_err:
+                    if attempt == 1:
+                        raise
+                    logger.warning(f"--- MCP: Restarting {client_filename} after: {session_err} ---")
+
+            content = [c.model_dump() for c in result.content]
+            failed = result.isError or any(
+                str(c.get("text", "")).startswith(ERROR_PREFIXES) for c in content
+            )
         except Exception as e:
             logger.error(f"--- MCP ERROR ({client_filename}): {str(e)} ---")
-            return f"Error executing tool {tool_name}: {str(e)}"
+            content = f"Error executing tool {tool_name}: {str(e)}"
+            failed = True
+
+        # Update Cache: per-tool TTL for results, short negative TTL for failures
+        if content:
+            try:
+                ttl = MCP_TOOL_CACHE_CONFIG.get(tool_name, {}).get("ttl", MCP_CACHE_EXPIRY)
+                await redis_client.set(
+                    cache_key,
+                    json.dumps({"error": content} if isinstance(content, str) else content),
+                    ex=MCP_NEGATIVE_CACHE_EXPIRY if failed else ttl
+                )
+            except Exception as cache_err:
+                logger.warning(f"MCP Cache write failed: {cache_err}")
+
+        return content
 
     async def get_market_intelligence(self, product_url: str) -> Dict[str, Any]:
         """Aggregates external marketplace data."""
         pricing = await self.call_tool("pricing_client.py", "get_competitor_prices", {"product_url": product_url})
         reviews = await self.call_tool("review_client.py", "analyze_product_reviews", {"product_url": product_url})
-        
+
         return {
             "pricing_data": pricing,
             "review_sentiment": reviews
@@ -82,11 +381,11 @@ class MCPManager:
         """Aggregates internal business unit data."""
         inventory = await self.call_tool("inventory_client.py", "get_stock_levels", {"product_id": product_id})
         catalog = await self.call_tool("catalog_client.py", "get_product_economics", {"product_id": product_id})
-        
+
         return {
             "inventory_status": inventory,
             "unit_economics": catalog
         }
 
 # Singleton instance for application-wide access
-mcp_manager = MCPManager()
\ No newline at end of file
+mcp_manager = MCPManager()
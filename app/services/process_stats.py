@@ -0,0 +1,50 @@
+import json
+import logging
+import os
+import socket
+import time
+from typing import Any, Callable, Dict
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+PROCESS_STATS_PUBLISH_INTERVAL = 10
+# A process that stops publishing (exited, or idle) drops out of reports after this
+PROCESS_STATS_TTL = 300
+
+
+class ProcessStatsPublisher:
+    """
+    Mirrors one component's in-process stats into Redis so the API can
+    report every worker and API process. Each process writes its own key,
+    <prefix>:<host>:<pid>, with a TTL, so replaced processes age out instead
+    of accumulating.
+    """
+
+    def __init__(self, prefix: str, interval: float = PROCESS_STATS_PUBLISH_INTERVAL, ttl: int = PROCESS_STATS_TTL):
+        self.prefix = prefix
+        self.interval = interval
+        self.ttl = ttl
+        self._last_published = 0.0
+
+    async def publish(self, client: redis.Redis, get_stats: Callable[[], Dict[str, Any]], force: bool = False):
+        """Writes get_stats() at most once per interval; failures are logged, never raised."""
+        now = time.monotonic()
+        if not force and now - self._last_published < self.interval:
+            return
+        self._last_published = now
+        try:
+            await client.set(
+                f"{self.prefix}:{socket.gethostname()}:{os.getpid()}", json.dumps(get_stats()), ex=self.ttl
+            )
+        except Exception as stats_err:
+            logger.warning(f"Stats publish to {self.prefix} failed: {stats_err}")
+
+
+async def read_process_stats(client: redis.Redis, prefix: str) -> Dict[str, Any]:
+    """Returns {"host:pid": stats} for every process that published under prefix within the TTL."""
+    keys = [key async for key in client.scan_iter(match=f"{prefix}:*", count=100)]
+    if not keys:
+        return {}
+    values = await client.mget(keys)
+    return {key[len(prefix) + 1:]: json.loads(data) for key, data in zip(keys, values) if data is not None}
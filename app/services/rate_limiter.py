@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional, Tuple
+import redis.asyncio as redis
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_KEY = "llm_rate_limit:mistral"
+
+# Refills both buckets from elapsed time and either reserves one request plus
+# `cost` tokens or returns how long the caller has to wait. Lua numbers are
+# truncated to integers in replies, hence tostring().
+_ACQUIRE_SCRIPT = """
+local rpm, tpm, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local s = redis.call('HMGET', KEYS[1], 'req', 'tok', 'ts', 'blocked_until')
+local req = tonumber(s[1]) or rpm
+local tok = tonumber(s[2]) or tpm
+local ts = tonumber(s[3]) or now
+local blocked = tonumber(s[4]) or 0
+local elapsed = math.max(0, now - ts)
+req = math.min(rpm, req + elapsed * rpm / 60)
+tok = math.min(tpm, tok + elapsed * tpm / 60)
+local wait = 0
+if blocked > now then
+  wait = blocked - now
+elseif req < 1 or tok < cost then
+  wait = math.max((1 - req) * 60 / rpm, (cost - tok) * 60 / tpm)
+else
+  req = req - 1
+  tok = tok - cost
+end
+redis.call('HSET', KEYS[1], 'req', req, 'tok', tok, 'ts', now, 'blocked_until', blocked)
+redis.call('EXPIRE', KEYS[1], 120)
+return tostring(wait)
+"""
+
+_BLOCK_SCRIPT = """
+local t = redis.call('TIME')
+local until_ts = tonumber(t[1]) + tonumber(t[2]) / 1000000 + tonumber(ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0
+if until_ts > current then
+  redis.call('HSET', KEYS[1], 'blocked_until', until_ts)
+end
+return 1
+"""
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Returns the back-off requested by a 429 response, or None for other errors."""
+    response = getattr(error, "response", None)
+    if response is None or getattr(response, "status_code", None) != 429:
+        return None
+    try:
+        return float(response.headers.get("retry-after", 1))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def _usage_tokens(result: Any) -> Optional[int]:
+    raw = result.get("raw") if isinstance(result, dict) else result
+    usage = getattr(raw, "usage_metadata", None)
+    return usage.get("total_tokens") if usage else None
+
+
+class LLMRateLimiter:
+    """
+    Token-bucket limiter for Mistral requests and tokens per minute.
+    Callers only wait when the budget is exhausted or the API returned 429.
+    The 'redis' backend shares one budget across every worker process.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = settings.LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = settings.LLM_TOKENS_PER_MINUTE,
+        backend: str = settings.LLM_RATE_LIMIT_BACKEND,
+    ):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True) if backend == "redis" else None
+
+        # Local bucket state
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def estimate_tokens(self, prompt: Any) -> int:
+        """Rough prompt size (~4 chars per token) plus the expected completion."""
+        estimate = len(str(prompt)) // 4 + settings.LLM_COMPLETION_TOKEN_ESTIMATE
+        return min(estimate, self.tpm)
+
+    def _try_acquire_local(self, cost: int) -> float:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+        if self._blocked_until > now:
+            return self._blocked_until - now
+        if self._requests < 1 or self._tokens < cost:
+            return max((1 - self._requests) * 60 / self.rpm, (cost - self._tokens) * 60 / self.tpm)
+        self._requests -= 1
+        self._tokens -= cost
+        return 0.0
+
+    async def _try_acquire(self, cost: int) -> float:
+        if self.redis_client is None:
+            return self._try_acquire_local(cost)
+        wait = await self.redis_client.eval(_ACQUIRE_SCRIPT, 1, RATE_LIMIT_KEY, self.rpm, self.tpm, cost)
+        return float(wait)
+
+    async def acquire(self, cost: int) -> float:
+        """Blocks until the request fits the budget; returns the time spent queued."""
+        start = time.monotonic()
+        while True:
+            wait = await self._try_acquire(cost)
+            if wait <= 0:
+                return time.monotonic() - start
+            await asyncio.sleep(wait)
+
+    async def block_for(self, seconds: float):
+        """Pauses every caller after the API signalled a rate limit."""
+        if self.redis_client is None:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        else:
+            await self.redis_client.eval(_BLOCK_SCRIPT, 1, RATE_LIMIT_KEY, seconds)
+
+    async def settle(self, estimated: int, actual: Optional[int]):
+        """Returns (or charges) the difference between estimated and real token usage."""
+        if actual is None:
+            return
+        if self.redis_client is None:
+            self._tokens = min(self.tpm, self._tokens + estimated - actual)
+        else:
+            await self.redis_client.hincrbyfloat(RATE_LIMIT_KEY, "tok", estimated - actual)
+
+    async def invoke(self, llm: Any, prompt: Any, max_attempts: int = 3) -> Tuple[Any, float]:
+        """
+        Runs llm.ainvoke(prompt) within the shared budget, retrying on 429.
+        Returns the result and the total seconds spent waiting for capacity.
+        """
+        cost = self.estimate_tokens(prompt)
+        queue_wait = 0.0
+        for attempt in range(max_attempts):
+            queue_wait += await self.acquire(cost)
+            try:
+                result = await llm.ainvoke(prompt)
+            except Exception as e:
+                retry_after = _retry_after(e)
+                if retry_after is None or attempt == max_attempts - 1:
+                    raise
+                logger.warning(f"--- MISTRAL 429: backing off {retry_after}s ---")
+                await self.block_for(retry_after)
+                continue
+            await self.settle(cost, _usage_tokens(result))
+            return result, queue_wait
+
+    async def stream(
+        self, llm: Any, prompt: Any, on_chunk: Callable[[Any], Awaitable[None]], max_attempts: int = 3
+    ) -> Tuple[Any, float]:
+        """
+        Runs llm.astream(prompt) within the shared budget, calling on_chunk with
+        the message accumulated so far after every chunk. A 429 is only retried
+        before the first chunk arrives. Returns the full message and queue wait.
+        """
+        cost = self.estimate_tokens(prompt)
+        queue_wait = 0.0
+        for attempt in range(max_attempts):
+            queue_wait += await self.acquire(cost)
+            gathered = None
+            try:
+                async for chunk in llm.astream(prompt):
+                    gathered = chunk if gathered is None else gathered + chunk
+                    await on_chunk(gathered)
+            except Exception as e:
+                retry_after = _retry_after(e)
+                if retry_after is None or gathered is not None or attempt == max_attempts - 1:
+                    raise
+                logger.warning(f"--- MISTRAL 429: backing off {retry_after}s ---")
+                await self.block_for(retry_after)
+                continue
+            await self.settle(cost, _usage_tokens(gathered))
+            return gathered, queue_wait
+
+
+# Process-wide limiter shared by every agent node
+llm_rate_limiter = LLMRateLimiter()
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Optional, Tuple
+import redis.asyncio as redis
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Only the holder of the lock may release it
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """
+    Cross-process request coalescing backed by Redis.
+
+    The first caller for a key takes a lock and computes the result (which
+    must land somewhere `load` can read it, e.g. a cache key). Concurrent
+    callers in any worker subscribe to the key's channel and wait for the
+    leader instead of repeating the work. The lock expires after
+    `lock_timeout`, so a crashed leader only stalls followers that long
+    before one of them takes over.
+    """
+
+    def __init__(self, lock_timeout: int = settings.SINGLE_FLIGHT_LOCK_TIMEOUT):
+        self.lock_timeout = lock_timeout
+        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+
+    async def do(
+        self,
+        key: str,
+        load: Callable[[], Awaitable[Optional[Any]]],
+        compute: Callable[[], Awaitable[Any]],
+        lock_timeout: Optional[int] = None,
+    ) -> Tuple[Any, bool]:
+        """
+        Returns (value, led): the computed value if this caller was the
+        leader, otherwise whatever `load` returns once the leader finishes.
+        """
+        lock_timeout = lock_timeout or self.lock_timeout
+        lock_key = f"singleflight:{key}"
+        channel = f"{lock_key}:done"
+
+        while True:
+            token = uuid.uuid4().hex
+            try:
+                acquired = await self.redis_client.set(lock_key, token, nx=True, ex=lock_timeout)
+            except Exception as lock_err:
+                # Coalescing is an optimization; never fail the call because of it
+                logger.warning(f"Single-flight lock failed for {key}: {lock_err}")
+                return await compute(), True
+
+            if acquired:
+                try:
+                    return await compute(), True
+                finally:
+                    await self.redis_client.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+                    await self.redis_client.publish(channel, "done")
+
+            value = await self._wait_for_leader(lock_key, channel, load)
+            if value is not None:
+                return value, False
+            # Leader failed without storing a result (or its lock expired): retry as leader
+
+    async def _wait_for_leader(
+        self, lock_key: str, channel: str, load: Callable[[], Awaitable[Optional[Any]]]
+    ) -> Optional[Any]:
+        pubsub = self.redis_client.pubsub()
+        try:
+            await pubsub.subscribe(channel)
+            # The leader may have finished between our SET NX and SUBSCRIBE
+            value = await load()
+            if value is not None:
+                return value
+
+            remaining = await self.redis_client.ttl(lock_key)
+            if remaining > 0:
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + remaining
+                while loop.time() < deadline:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=max(0.0, deadline - loop.time())
+                    )
+                    if message is not None:
+                        break
+            return await load()
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from uuid import UUID
+import redis.asyncio as redis
+from sqlalchemy import update
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.job_models import Job
+from app.services.process_stats import ProcessStatsPublisher, read_process_stats
+
+logger = logging.getLogger(__name__)
+
+redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+STATUS_WRITER_STATS_KEY = "status_writer_stats"
+
+
+class JobStatusWriter:
+    """
+    Write-behind buffer for intermediate job statuses.
+
+    Broadcaster hops only record the latest status per job in memory; a
+    background task flushes every job's pending status in one batched
+    UPDATE per interval, so N concurrent jobs cost one round-trip rather
+    than N. Terminal statuses bypass the buffer: write_terminal drops any
+    pending status for the job and writes synchronously, serialized after
+    an in-flight flush so an older status can never overwrite it.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = settings.STATUS_FLUSH_INTERVAL,
+        max_batch: int = settings.STATUS_FLUSH_MAX_BATCH,
+    ):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        # job_id -> (status, monotonic time first enqueued)
+        self._pending: Dict[str, Tuple[str, float]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stats_publisher = ProcessStatsPublisher(STATUS_WRITER_STATS_KEY)
+        self.stats = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "flushes": 0,
+            "rows_flushed": 0,
+            "max_batch_size": 0,
+            "last_lag_ms": 0.0,
+            "max_lag_ms": 0.0,
+            "terminal_writes": 0,
+            "failed_flushes": 0,
+        }
+
+    def _bind_loop(self):
+        # The lock and flusher task belong to the loop that created them
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def enqueue(self, job_id: str, status: str):
+        """Records a job's latest status; it reaches Postgres on the next flush."""
+        self._bind_loop()
+        self.stats["enqueued"] += 1
+        previous = self._pending.get(job_id)
+        if previous:
+            self.stats["coalesced"] += 1
+        # Lag is measured from the oldest unflushed change for the job
+        self._pending[job_id] = (status, previous[1] if previous else time.monotonic())
+        if len(self._pending) >= self.max_batch:
+            self._loop.create_task(self.flush())
+
+    async def flush(self):
+        """Writes all pending statuses in one executemany UPDATE."""
+        self._bind_loop()
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            now = datetime.utcnow()
+            try:
+                async with AsyncSessionLocal() as db:
+                    # ORM bulk UPDATE by primary key: no SELECT, one statement for the whole batch
+                    await db.execute(
+                        update(Job),
+                        [
+                            {"id": UUID(job_id), "status": status, "updated_at": now}
+                            for job_id, (status, _) in batch.items()
+                        ],
+                    )
+                    await db.commit()
+            except Exception as flush_err:
+                self.stats["failed_flushes"] += 1
+                logger.warning(f"--- STATUS WRITER: flush of {len(batch)} jobs failed: {flush_err} ---")
+                # Re-queue unless a newer status arrived meanwhile
+                for job_id, entry in batch.items():
+                    self._pending.setdefault(job_id, entry)
+                return
+
+            flushed_at = time.monotonic()
+            lag_ms = max((flushed_at - enqueued) * 1000 for _, enqueued in batch.values())
+            self.stats["flushes"] += 1
+            self.stats["rows_flushed"] += len(batch)
+            self.stats["max_batch_size"] = max(self.stats["max_batch_size"], len(batch))
+            self.stats["last_lag_ms"] = round(lag_ms, 1)
+            self.stats["max_lag_ms"] = round(max(self.stats["max_lag_ms"], lag_ms), 1)
+        await self._stats_publisher.publish(redis_client, self.get_stats)
+
+    async def write_terminal(self, job_id: str, status: str, **values: Any):
+        """
+        Synchronously writes a final status (plus any other Job columns) in a
+        single UPDATE, discarding the job's buffered intermediate status.
+        """
+        self._bind_loop()
+        async with self._lock:
+            self._pending.pop(job_id, None)
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Job)
+                    .where(Job.id == UUID(job_id))
+                    .values(status=status, updated_at=datetime.utcnow(), **values)
+                )
+                await db.commit()
+            self.stats["terminal_writes"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "pending": len(self._pending),
+            "avg_batch_size": round(self.stats["rows_flushed"] / self.stats["flushes"], 2) if self.stats["flushes"] else 0.0,
+        }
+
+
+status_writer = JobStatusWriter()
+
+
+async def get_status_writer_stats() -> Dict[str, Any]:
+    """Returns status writer stats published by every worker process."""
+    return await read_process_stats(redis_client, STATUS_WRITER_STATS_KEY)
@@ -1,34 +1,398 @@
 # app/services/stream_service.py
+import asyncio
 import json
-from typing import Dict, List
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+import redis.asyncio as redis
 from fastapi import WebSocket
+from app.core.config import settings
+from app.services.process_stats import ProcessStatsPublisher, read_process_stats
+
+logger = logging.getLogger(__name__)
+
+JOB_EVENTS_CHANNEL_PREFIX = "job_events:"
+JOB_EVENTS_LOG_PREFIX = "job_events_log:"
+STREAM_STATS_KEY = "stream_stats"
+# How long the reader blocks for a message before applying queued (un)subscribes
+STREAM_READ_TIMEOUT = 0.1
+# 1013 "Try Again Later": the client fell too far behind and should reconnect
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+# Appends the event to the job's capped log and publishes it with its log id
+# in one round trip. KEYS: log stream, channel; ARGV: event json, maxlen, ttl
+_PUBLISH_SCRIPT = """
+local id = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', 'event', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('PUBLISH', KEYS[2], '{"id":"' .. id .. '","event":' .. ARGV[1] .. '}')
+return id
+"""
+
+
+def _parse_event_id(event_id: Optional[str]) -> Tuple[int, int]:
+    """Orders Redis stream ids ("<ms>-<seq>"); events without an id sort first."""
+    if not event_id:
+        return (0, 0)
+    ms, _, seq = event_id.partition("-")
+    return (int(ms), int(seq or 0))
+
+
+class ClientConnection:
+    """
+    One WebSocket with its own bounded send queue and writer task, so a
+    stalled client only ever delays itself.
+
+    When the client falls behind, token events are merged into the queued
+    token (coalesce) or discarded once the queue is full (drop). Status
+    events are never dropped: a client whose queue is full of them, whose
+    oldest event exceeds the lag threshold, or whose send times out is
+    evicted instead.
+
+    Live events arriving while the job's log is being replayed are held
+    back and released afterwards, skipping any the replay already covered.
+    """
+
+    def __init__(self, manager: "StreamManager", job_id: str, websocket: WebSocket):
+        self.manager = manager
+        self.job_id = job_id
+        self.websocket = websocket
+        # (monotonic time enqueued, event)
+        self.queue: Deque[Tuple[float, Dict[str, Any]]] = deque()
+        self._last_id = (0, 0)
+        self._held: Optional[List[Dict[str, Any]]] = []
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def finish_replay(self, events: List[Dict[str, Any]]) -> bool:
+        """Queues the replayed log, then the live events held meanwhile."""
+        held, self._held = self._held, None
+        return all(self.offer(event) for event in events + held)
+
+    def offer(self, event: Dict[str, Any]) -> bool:
+        """Queues an event without blocking; returns False if the client should be evicted."""
+        if self._held is not None:
+            self._held.append(event)
+            return True
+        event_id = _parse_event_id(event.get("id"))
+        if event.get("id"):
+            if event_id <= self._last_id:
+                return True  # Already queued via the replay
+            self._last_id = event_id
+        now = time.monotonic()
+        if self.queue and now - self.queue[0][0] > self.manager.max_lag:
+            return False
+
+        if event["type"] == "token" and self.queue:
+            tail_time, tail = self.queue[-1]
+            if (
+                self.manager.token_policy == "coalesce"
+                and tail["type"] == "token"
+                and tail.get("source") == event.get("source")
+            ):
+                # The merged event carries the newest id so a reconnect resumes after it
+                self.queue[-1] = (tail_time, {**event, "token": tail["token"] + event["token"]})
+                self.manager.stats["tokens_coalesced"] += 1
+                return True
+            if len(self.queue) >= self.manager.max_queue:
+                self.manager.stats["tokens_dropped"] += 1
+                return True
+
+        if len(self.queue) >= self.manager.max_queue:
+            return False
+        self.queue.append((now, event))
+        self._wakeup.set()
+        return True
+
+    async def _write_loop(self):
+        while True:
+            while not self.queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            _, event = self.queue.popleft()
+            try:
+                await asyncio.wait_for(self.websocket.send_json(event), timeout=self.manager.send_timeout)
+            except Exception as send_err:
+                logger.info(f"--- STREAM: evicting client of job {self.job_id}: {send_err!r} ---")
+                # Evict from a separate task: eviction cancels this writer
+                asyncio.create_task(self.manager.evict(self.job_id, self.websocket, slow=False))
+                return
+            self.manager.stats["events_sent"] += 1
+
+    async def close(self, code: Optional[int] = None):
+        self._writer.cancel()
+        if code is not None:
+            try:
+                await asyncio.wait_for(self.websocket.close(code=code), timeout=self.manager.send_timeout)
+            except Exception:
+                pass
+
+
+class _QueueSink:
+    """Stands in for a WebSocket so SSE clients share the fan-out, queueing and eviction."""
+
+    CLOSED = object()
 
-class StreamManager:
     def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        # One slot: a slow SSE reader backs up into its ClientConnection queue
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, event: Dict[str, Any]):
+        await self.queue.put(event)
 
-    async def connect(self, job_id: str, websocket: WebSocket):
+    async def close(self, code: Optional[int] = None):
+        try:
+            self.queue.put_nowait(self.CLOSED)
+        except asyncio.QueueFull:
+            self.queue.get_nowait()
+            self.queue.put_nowait(self.CLOSED)
+
+
+class StreamManager:
+    """
+    Job event bus between pipeline workers and WebSocket clients.
+
+    broadcast_* publish to a Redis channel per job, so events raised inside
+    a Celery worker reach clients connected to any API process. Each API
+    process subscribes to a job's channel only while it holds at least one
+    local socket for that job (the connection map doubles as the refcount)
+    and hands incoming events to each socket's send queue from a single
+    reader task. The reader is also the only task that touches the PubSub:
+    connect and disconnect queue their subscription changes for it.
+
+    Every event is also appended to a capped Redis Stream per job, so a
+    client connecting late (or reconnecting with the last id it saw)
+    replays what it missed before switching to the live feed.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = settings.STREAM_SEND_QUEUE_SIZE,
+        token_policy: str = settings.STREAM_TOKEN_POLICY,
+        max_lag: float = settings.STREAM_MAX_LAG_SECONDS,
+        send_timeout: float = settings.STREAM_SEND_TIMEOUT,
+    ):
+        self.max_queue = max_queue
+        self.token_policy = token_policy
+        self.max_lag = max_lag
+        self.send_timeout = send_timeout
+        self.active_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        self._pubsub: Optional[redis.client.PubSub] = None
+        self._reader: Optional[asyncio.Task] = None
+        # (PubSub method, channel, future resolved once applied) for the reader
+        self._commands: Deque[Tuple[str, str, Optional[asyncio.Future]]] = deque()
+        self._subscribed: Dict[str, asyncio.Future] = {}
+        self._stats_publisher = ProcessStatsPublisher(STREAM_STATS_KEY)
+        self.stats = {
+            "events_received": 0,
+            "events_sent": 0,
+            "events_replayed": 0,
+            "tokens_coalesced": 0,
+            "tokens_dropped": 0,
+            "evicted_slow": 0,
+            "evicted_dead": 0,
+        }
+
+    @staticmethod
+    def _channel(job_id: str) -> str:
+        return f"{JOB_EVENTS_CHANNEL_PREFIX}{job_id}"
+
+    @staticmethod
+    def _log_key(job_id: str) -> str:
+        return f"{JOB_EVENTS_LOG_PREFIX}{job_id}"
+
+    async def connect(self, job_id: str, websocket: WebSocket, last_event_id: Optional[str] = None):
+        """
+        Registers the socket, replays the job's logged events after
+        last_event_id (all of them if None), then streams live events.
+        """
         await websocket.accept()
+        # No awaits from here to the reader check, so the bookkeeping and the
+        # queued subscription can't interleave with another connect/disconnect
         if job_id not in self.active_connections:
-            self.active_connections[job_id] = []
-        self.active_connections[job_id].append(websocket)
+            self.active_connections[job_id] = {}
+            # First local viewer of this job: have the reader listen for its events
+            self._subscribed[job_id] = asyncio.get_running_loop().create_future()
+            self._commands.append(("subscribe", self._channel(job_id), self._subscribed[job_id]))
+        subscribed = self._subscribed[job_id]
+        connection = ClientConnection(self, job_id, websocket)
+        self.active_connections[job_id][websocket] = connection
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read_events())
+
+        # Subscribed before reading the log, so nothing falls between the two
+        await asyncio.shield(subscribed)
+        if not connection.finish_replay(await self.replay(job_id, last_event_id)):
+            await self.evict(job_id, websocket, slow=True)
+
+    async def replay(self, job_id: str, last_event_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Returns logged events after last_event_id, oldest first."""
+        start = f"({last_event_id}" if last_event_id else "-"
+        try:
+            entries = await self.redis_client.xrange(self._log_key(job_id), min=start, max="+")
+        except Exception as log_err:
+            logger.warning(f"--- STREAM: replay for job {job_id} failed: {log_err} ---")
+            return []
+        self.stats["events_replayed"] += len(entries)
+        return [{**json.loads(fields["event"]), "id": entry_id} for entry_id, fields in entries]
+
+    async def event_stream(self, job_id: str, last_event_id: Optional[str] = None) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Same feed as the WebSocket for Server-Sent Events clients. Yields
+        None after STREAM_SSE_KEEPALIVE seconds without events so the
+        caller can send a keepalive; ends if the client is evicted.
+        """
+        sink = _QueueSink()
+        await self.connect(job_id, sink, last_event_id)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(sink.queue.get(), timeout=settings.STREAM_SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event is _QueueSink.CLOSED:
+                    return
+                yield event
+        finally:
+            await self.disconnect(job_id, sink)
+
+    async def disconnect(self, job_id: str, websocket: WebSocket, close_code: Optional[int] = None):
+        connections = self.active_connections.get(job_id)
+        connection = connections.pop(websocket, None) if connections is not None else None
+        if connection is None:
+            return
+        if not connections:
+            # Last local viewer gone: idle jobs cost no subscription
+            del self.active_connections[job_id]
+            self._subscribed.pop(job_id, None)
+            self._commands.append(("unsubscribe", self._channel(job_id), None))
+        await connection.close(close_code)
+
+    async def evict(self, job_id: str, websocket: WebSocket, slow: bool):
+        """Drops a client that fell behind (closing it with 1013) or whose socket is dead."""
+        if websocket not in self.active_connections.get(job_id, {}):
+            return
+        self.stats["evicted_slow" if slow else "evicted_dead"] += 1
+        await self.disconnect(job_id, websocket, close_code=SLOW_CLIENT_CLOSE_CODE if slow else None)
+
+    async def _read_events(self):
+        """Delivers published events to local send queues while any job is subscribed."""
+        if self._pubsub is None:
+            self._pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        while True:
+            await self._apply_commands()
+            # No await between this check and returning: a connect that runs
+            # after it sees the task done and starts a new reader
+            if not self.active_connections and not self._commands:
+                return
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=STREAM_READ_TIMEOUT)
+            except Exception as bus_err:
+                logger.warning(f"--- STREAM: event bus read failed, resubscribing: {bus_err} ---")
+                await asyncio.sleep(1)
+                await self._resubscribe()
+                continue
+            await self._stats_publisher.publish(self.redis_client, self.get_stats)
+            if not message or message["type"] != "message":
+                continue
+            self.stats["events_received"] += 1
+            job_id = message["channel"][len(JOB_EVENTS_CHANNEL_PREFIX):]
+            envelope = json.loads(message["data"])
+            await self._deliver(job_id, {**envelope["event"], "id": envelope["id"]})
+
+    async def _apply_commands(self):
+        """Runs the subscription changes queued by connect/disconnect, in order."""
+        while self._commands:
+            action, channel, applied = self._commands.popleft()
+            try:
+                await getattr(self._pubsub, action)(channel)
+            except Exception as bus_err:
+                logger.warning(f"--- STREAM: {action} failed, resubscribing: {bus_err} ---")
+                await self._resubscribe()
+            # Best-effort either way: the connecting client still gets the replayed log
+            if applied is not None and not applied.done():
+                applied.set_result(None)
+
+    async def _resubscribe(self):
+        # Only called from the reader task, which owns the PubSub
+        try:
+            await self._pubsub.aclose()
+        except Exception:
+            pass
+        self._pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        channels = [self._channel(job_id) for job_id in self.active_connections]
+        try:
+            if channels:
+                await self._pubsub.subscribe(*channels)
+        except Exception as bus_err:
+            logger.warning(f"--- STREAM: resubscribe failed: {bus_err} ---")
 
-    def disconnect(self, job_id: str, websocket: WebSocket):
-        if job_id in self.active_connections:
-            self.active_connections[job_id].remove(websocket)
+    async def _deliver(self, job_id: str, event: dict):
+        # Enqueueing never blocks, so fan-out cost is independent of client speed
+        lagging = [
+            websocket
+            for websocket, connection in list(self.active_connections.get(job_id, {}).items())
+            if not connection.offer(event)
+        ]
+        if lagging:
+            logger.info(f"--- STREAM: evicting {len(lagging)} lagging client(s) of job {job_id} ---")
+            await asyncio.gather(*(self.evict(job_id, websocket, slow=True) for websocket in lagging))
+
+    async def _publish(self, job_id: str, event: dict):
+        try:
+            await self.redis_client.eval(
+                _PUBLISH_SCRIPT, 2, self._log_key(job_id), self._channel(job_id),
+                json.dumps(event), settings.STREAM_LOG_MAXLEN, settings.STREAM_LOG_TTL,
+            )
+        except Exception as bus_err:
+            # Streaming is best-effort; the pipeline must not fail on it
+            logger.warning(f"--- STREAM: publish for job {job_id} failed: {bus_err} ---")
 
     async def broadcast_status(self, job_id: str, message: dict):
-        """Broadcasts status updates (existing)."""
-        if job_id in self.active_connections:
-            for connection in self.active_connections[job_id]:
-                await connection.send_json({"type": "status", "data": message})
+        """Publishes a status update to every API process viewing the job."""
+        await self._publish(job_id, {"type": "status", "data": message})
 
-    async def broadcast_token(self, job_id: str, token: str):
+    async def broadcast_token(self, job_id: str, token: str, source: Optional[str] = None):
         """
-        New: Broadcasts individual tokens for real-time text generation UI.
+        Publishes generated text for real-time text generation UI; source
+        names the agent producing it.
         """
-        if job_id in self.active_connections:
-            for connection in self.active_connections[job_id]:
-                await connection.send_json({"type": "token", "token": token})
+        event = {"type": "token", "token": token}
+        if source:
+            event["source"] = source
+        await self._publish(job_id, event)
+
+    async def broadcast_token_reset(self, job_id: str, source: Optional[str] = None):
+        """Tells clients to discard the text streamed so far for source; replacement tokens follow."""
+        event = {"type": "token_reset"}
+        if source:
+            event["source"] = source
+        await self._publish(job_id, event)
+
+    def get_stats(self) -> Dict[str, Any]:
+        jobs = {
+            job_id: {
+                "connections": len(connections),
+                "queue_depth": sum(len(c.queue) for c in connections.values()),
+                "max_queue_depth": max((len(c.queue) for c in connections.values()), default=0),
+            }
+            for job_id, connections in self.active_connections.items()
+        }
+        return {
+            **self.stats,
+            "connections": sum(job["connections"] for job in jobs.values()),
+            "jobs": jobs,
+        }
+
+
+stream_manager = StreamManager()
+
 
-stream_manager = StreamManager()
\ No newline at end of file
+async def get_stream_stats() -> Dict[str, Any]:
+    """Returns stream stats published by every API process."""
+    return await read_process_stats(stream_manager.redis_client, STREAM_STATS_KEY)
@@ -1,11 +1,19 @@
 import asyncio
 import logging
+import os
+import threading
 from celery import Celery
+from kombu import Queue
+from celery.signals import worker_process_init, worker_shutdown
 from app.core.config import settings
-from app.agents.orchestrator import app_workflow
-from app.db.session import AsyncSessionLocal
-from app.services import job_service
-from app.models.job_models import Job  # Used for direct DB updating
+from app.db.session import AsyncSessionLocal, engine
+from app.agents.orchestrator import get_app_workflow
+from app.services.checkpointer import checkpointer_registry
+from app.services.status_writer import status_writer
+from app.services.llm_registry import llm_registry
+from app.services.mcp_service import mcp_pool
+from app.services.job_queue import INTERACTIVE_QUEUE, JOB_QUEUES, job_queue
+from app.services.job_service import claim_job
 
 # Initialize logger for worker visibility
 logger = logging.getLogger(__name__)
@@ -17,30 +25,131 @@ celery_app = Celery(
 )
 
 # Production worker settings
+# With the threads pool, task threads only hand pipelines to the process's
+# event loop and wait, so concurrency is the per-process in-flight limit.
 celery_app.conf.update(
     task_serializer="json",
     accept_content=["json"],
     result_serializer="json",
     timezone="UTC",
     enable_utc=True,
-    worker_concurrency=settings.WORKER_CONCURRENCY,
+    worker_pool=settings.WORKER_POOL,
+    worker_concurrency=(
+        settings.PIPELINE_MAX_IN_FLIGHT if settings.WORKER_POOL == "threads" else settings.WORKER_CONCURRENCY
+    ),
+    worker_prefetch_multiplier=1,
+    # Separate queues so resumes and interactive jobs never wait behind bulk submissions
+    task_queues=[Queue(name) for name in JOB_QUEUES],
+    task_default_queue=INTERACTIVE_QUEUE,
     task_track_started=True,
-    task_time_limit=3600, # 1 hour max execution
+    task_time_limit=3600, # 1 hour max execution (prefork only; see PIPELINE_TIMEOUT)
 )
 
+
+class WorkerEventLoop:
+    """
+    A long-lived event loop running in a background thread of the worker process.
+
+    Every pipeline in the process runs on this one loop, so the async DB
+    engine, Redis clients, MCP sessions and HTTP pools are bound once and
+    shared by all in-flight jobs instead of being rebuilt per task.
+    """
+
+    def __init__(self, max_in_flight: int = settings.PIPELINE_MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self.loop = asyncio.new_event_loop()
+        self._in_flight = None
+        self._thread = threading.Thread(target=self._run, name="pipeline-event-loop", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _limited(self, coro):
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        async with self._in_flight:
+            return await coro
+
+    def run(self, coro):
+        """Runs a coroutine on the shared loop and blocks the calling task thread until it finishes."""
+        return asyncio.run_coroutine_threadsafe(self._limited(coro), self.loop).result()
+
+    def stop(self, cleanup):
+        """Runs the async cleanup on the loop, then stops it."""
+        try:
+            asyncio.run_coroutine_threadsafe(cleanup(), self.loop).result(timeout=30)
+        except Exception as e:
+            logger.warning(f"Worker loop cleanup failed: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+_worker_loop = None
+_worker_loop_pid = None
+_worker_loop_lock = threading.Lock()
+
+
+def get_worker_loop() -> WorkerEventLoop:
+    global _worker_loop, _worker_loop_pid
+    with _worker_loop_lock:
+        if _worker_loop is None or _worker_loop_pid != os.getpid():
+            if _worker_loop_pid is not None:
+                # Forked child: the parent's pooled connections must not be reused here
+                engine.sync_engine.dispose(close=False)
+            _worker_loop = WorkerEventLoop()
+            _worker_loop_pid = os.getpid()
+        return _worker_loop
+
+
+async def _close_async_resources():
+    await status_writer.flush()
+    await llm_registry.aclose()
+    await checkpointer_registry.aclose()
+    await mcp_pool.close_all()
+    await engine.dispose()
+
+
+@worker_process_init.connect
+def _init_worker_process(**kwargs):
+    # Prefork children inherit the parent's engine pool; drop it before first use
+    engine.sync_engine.dispose(close=False)
+
+
+@worker_shutdown.connect
+def _shutdown_worker_loop(**kwargs):
+    if _worker_loop is not None and _worker_loop_pid == os.getpid():
+        _worker_loop.stop(_close_async_resources)
+
+
 @celery_app.task(name="run_agent_pipeline_task", bind=True, max_retries=3)
 def run_agent_pipeline_task(self, job_id: str, product_url: str, resume: bool = False):
     """
     Synchronous wrapper for the async agent pipeline.
-    Uses a clean event loop per task execution to prevent loop-sharing issues.
+    Submits the pipeline to the process's persistent event loop, where it
+    runs concurrently with the other in-flight jobs of this worker.
     """
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+    return get_worker_loop().run(_execute_pipeline(job_id, product_url, resume))
+
+@celery_app.task(name="run_next_job_task", bind=True)
+def run_next_job_task(self, queue: str):
+    """
+    Fair-share slot: runs whichever job is next in the queue's per-user
+    rotation rather than a job fixed at submission time.
+    """
+    return get_worker_loop().run(_run_next_job(queue))
 
-    return loop.run_until_complete(_execute_pipeline(job_id, product_url, resume))
+async def _run_next_job(queue: str):
+    job = await job_queue.pop(queue)
+    if job is None:
+        logger.warning(f"Slot on queue {queue} found no job")
+        return None
+    async with AsyncSessionLocal() as db:
+        if not await claim_job(db, job["job_id"]):
+            logger.info(f"Skipping job {job['job_id']}: no longer active")
+            return None
+    return await _execute_pipeline(job["job_id"], job["product_url"], job["resume"])
 
 async def _execute_pipeline(job_id: str, product_url: str, resume: bool):
     """
@@ -51,12 +160,14 @@ async def _execute_pipeline(job_id: str, product_url: str, resume: bool):
     
     # thread_id is critical for LangGraph PostgresSaver to track state
     config = {"configurable": {"thread_id": job_id}}
+    app_workflow = await get_app_workflow()
     
-    # If resuming, initial_state MUST be None so LangGraph loads from PostgresSaver
+    # If resuming, initial_state MUST be None so LangGraph continues after the last completed node
     initial_state = None if resume else {
         "job_id": job_id,
         "product_url": product_url,
         "research_data": [],
+        "tool_results": {},
         "total_tokens": 0,
         "total_cost": 0.0,
         "node_metrics": {},
@@ -67,36 +178,37 @@ async def _execute_pipeline(job_id: str, product_url: str, resume: bool):
     }
     
     try:
-        # Run the workflow and capture the final state output
-        final_state = await app_workflow.ainvoke(initial_state, config=config)
-        
-        # Open DB Session to save the real data to the Job row
-        async with AsyncSessionLocal() as db:
-            job = await db.get(Job, job_id)
-            if job:
-                # Handle Pydantic model serialization if analysis_result is an object
-                result_data = final_state.get("analysis_result")
-                if hasattr(result_data, 'model_dump'):
-                    job.result = result_data.model_dump()
-                else:
-                    job.result = result_data
-                
-                # Write the new real metrics into the JSON columns
-                job.execution_timeline = final_state.get("execution_timeline", [])
-                job.confidence_metrics = final_state.get("confidence_metrics", {})
-                job.cost_metrics = final_state.get("cost_metrics", {})
-                job.status = "completed"
-                
-                await db.commit()
-                logger.info(f"Successfully saved metrics to Postgres for Job {job_id}")
+        # saver_node persists every final field and the terminal status in one UPDATE.
+        # The timeout lives here so a timed-out job is still marked failed below.
+        await asyncio.wait_for(app_workflow.ainvoke(initial_state, config=config), timeout=settings.PIPELINE_TIMEOUT)
+        logger.info(f"Pipeline completed for Job {job_id}")
+
+        # Finished threads only need their final checkpoint
+        await checkpointer_registry.prune_thread(job_id)
+        await checkpointer_registry.prune_expired()
 
+    except asyncio.TimeoutError:
+        logger.error(f"Pipeline timed out for Job {job_id} after {settings.PIPELINE_TIMEOUT}s")
+        await status_writer.write_terminal(
+            job_id,
+            status="failed",
+            error_message=f"Worker Error: pipeline exceeded {settings.PIPELINE_TIMEOUT}s"
+        )
+        raise
+    except asyncio.CancelledError:
+        # Worker shutdown: record the failure (shielded from the cancellation) before propagating
+        logger.error(f"Pipeline cancelled for Job {job_id}")
+        await asyncio.shield(status_writer.write_terminal(
+            job_id,
+            status="failed",
+            error_message="Worker Error: pipeline cancelled"
+        ))
+        raise
     except Exception as e:
         logger.error(f"Pipeline failed for Job {job_id}: {str(e)}")
-        async with AsyncSessionLocal() as db:
-            await job_service.update_job_status(
-                db, 
-                job_id, 
-                status="failed", 
-                error=f"Worker Error: {str(e)}"
-            )
+        await status_writer.write_terminal(
+            job_id,
+            status="failed",
+            error_message=f"Worker Error: {str(e)}"
+        )
         raise e
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""add_product_embedding_indexes
+
+Revision ID: b7d4e1a9c350
+Revises: 781002c89622
+Create Date: 2026-10-17 10:12:44.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d4e1a9c350'
+down_revision: Union[str, Sequence[str], None] = '781002c89622'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_product_embeddings_job_id'), 'product_embeddings', ['job_id'], unique=False)
+    op.create_index(
+        'ix_product_embeddings_embedding_hnsw',
+        'product_embeddings',
+        ['embedding'],
+        unique=False,
+        postgresql_using='hnsw',
+        postgresql_with={'m': 16, 'ef_construction': 64},
+        postgresql_ops={'embedding': 'vector_cosine_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_embeddings_embedding_hnsw', table_name='product_embeddings')
+    op.drop_index(op.f('ix_product_embeddings_job_id'), table_name='product_embeddings')
@@ -0,0 +1,47 @@
+"""add_active_job_unique_index
+
+Revision ID: c2e8f5b1d764
+Revises: b7d4e1a9c350
+Create Date: 2026-10-17 11:40:03.667129
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2e8f5b1d764'
+down_revision: Union[str, Sequence[str], None] = 'b7d4e1a9c350'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Every non-terminal status counts as active (mirrors ACTIVE_JOB_PREDICATE)
+ACTIVE_PREDICATE = "status NOT IN ('completed', 'failed')"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing duplicates would block the unique index: keep the newest active job per URL
+    op.execute(f"""
+        UPDATE jobs SET status = 'failed', error_message = 'Superseded by a newer job for the same URL'
+        WHERE {ACTIVE_PREDICATE}
+          AND id NOT IN (
+            SELECT DISTINCT ON (product_url) id FROM jobs
+            WHERE {ACTIVE_PREDICATE}
+            ORDER BY product_url, created_at DESC
+          )
+    """)
+    op.create_index(
+        'uq_jobs_active_product_url',
+        'jobs',
+        ['product_url'],
+        unique=True,
+        postgresql_where=sa.text(ACTIVE_PREDICATE),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_jobs_active_product_url', table_name='jobs', postgresql_where=sa.text(ACTIVE_PREDICATE))
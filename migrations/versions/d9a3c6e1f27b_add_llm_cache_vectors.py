@@ -0,0 +1,37 @@
+"""add_llm_cache_vectors
+
+Revision ID: d9a3c6e1f27b
+Revises: e5f19a3c7b28
+Create Date: 2026-10-17 18:40:12.381907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import pgvector
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9a3c6e1f27b'
+down_revision: Union[str, Sequence[str], None] = 'e5f19a3c7b28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'llm_cache_vectors',
+        sa.Column('key', sa.Text(), nullable=False),
+        sa.Column('namespace', sa.Text(), nullable=False),
+        sa.Column('embedding', pgvector.sqlalchemy.vector.VECTOR(dim=1024), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index(op.f('ix_llm_cache_vectors_namespace'), 'llm_cache_vectors', ['namespace'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_llm_cache_vectors_namespace'), table_name='llm_cache_vectors')
+    op.drop_table('llm_cache_vectors')
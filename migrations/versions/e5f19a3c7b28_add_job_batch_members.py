@@ -0,0 +1,37 @@
+"""add_job_batch_members
+
+Revision ID: e5f19a3c7b28
+Revises: c2e8f5b1d764
+Create Date: 2026-10-17 15:12:48.204511
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f19a3c7b28'
+down_revision: Union[str, Sequence[str], None] = 'c2e8f5b1d764'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'job_batch_members',
+        sa.Column('batch_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('job_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.ForeignKeyConstraint(['job_id'], ['jobs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('batch_id', 'job_id'),
+    )
+    op.create_index(op.f('ix_job_batch_members_job_id'), 'job_batch_members', ['job_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_job_batch_members_job_id'), table_name='job_batch_members')
+    op.drop_table('job_batch_members')
@@ -0,0 +1,146 @@
+# scripts/benchmark_vector_index.py
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List, Optional, Set
+import numpy as np
+from sqlalchemy import text
+from app.db.session import engine
+
+EF_SEARCH_VALUES = [10, 20, 40, 80, 160]
+ITERATIVE_SCAN_MODES = ["off", "strict_order"]
+
+
+def random_vectors(count: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def to_pgvector(vector: np.ndarray) -> str:
+    return "[" + ",".join(f"{x:.6f}" for x in vector) + "]"
+
+
+async def build_table(conn, table: str, rows: int, dim: int, jobs: int):
+    """
+    Creates a scratch table of random vectors spread over `jobs` job ids, with
+    the same indexes as product_embeddings (HNSW with the migration's parameters
+    plus a btree on job_id).
+    """
+    await conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+    await conn.execute(text(f"CREATE TABLE {table} (id bigint PRIMARY KEY, job_id int, embedding vector({dim}))"))
+    # Vectors are generated server-side so 1M rows don't have to cross the wire
+    await conn.execute(text(
+        f"INSERT INTO {table} "
+        f"SELECT g, g % {jobs}, (SELECT array_agg(random() - 0.5) FROM generate_series(1, {dim}) WHERE g > 0)::vector "
+        f"FROM generate_series(1, {rows}) g"
+    ))
+    await conn.execute(text(f"CREATE INDEX ON {table} (job_id)"))
+    start = time.perf_counter()
+    await conn.execute(text(
+        f"CREATE INDEX ON {table} USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+    ))
+    print(f"  built HNSW index on {rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+
+async def top_k(conn, table: str, query: str, k: int, job_id: Optional[int] = None) -> Set[int]:
+    # Same shape as KnowledgeService.query_knowledge_base when job_id is given
+    where = "WHERE job_id = :job_id" if job_id is not None else ""
+    result = await conn.execute(
+        text(f"SELECT id FROM {table} {where} ORDER BY embedding <=> CAST(:q AS vector) LIMIT :k"),
+        {"q": query, "k": k, "job_id": job_id},
+    )
+    return {row.id for row in result}
+
+
+async def exact_neighbours(
+    conn, table: str, queries: List[str], k: int, job_ids: Optional[List[int]] = None
+) -> List[Set[int]]:
+    # Ground truth: no index scans (the filtered case falls back to a seq scan + sort)
+    await conn.execute(text("SET enable_indexscan = off"))
+    await conn.execute(text("SET enable_bitmapscan = off"))
+    job_ids = job_ids or [None] * len(queries)
+    truth = [await top_k(conn, table, q, k, job_id) for q, job_id in zip(queries, job_ids)]
+    await conn.execute(text("RESET enable_indexscan"))
+    await conn.execute(text("RESET enable_bitmapscan"))
+    return truth
+
+
+async def measure(conn, table: str, queries: List[str], truth: List[Set[int]], k: int, job_ids=None) -> Dict:
+    job_ids = job_ids or [None] * len(queries)
+    latencies, recalls, returned = [], [], []
+    for query, expected, job_id in zip(queries, truth, job_ids):
+        start = time.perf_counter()
+        found = await top_k(conn, table, query, k, job_id)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(found & expected) / k)
+        returned.append(len(found))
+    latencies.sort()
+    return {
+        "recall": statistics.mean(recalls),
+        # Post-filtered HNSW can return fewer than k rows: this is what the filtered pass checks
+        "returned": statistics.mean(returned),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+async def benchmark(rows: int, dim: int, queries: int, k: int, jobs: int) -> List[Dict]:
+    table = f"vector_bench_{rows}"
+    rng = np.random.default_rng(rows)
+    query_vectors = [to_pgvector(v) for v in random_vectors(queries, dim, rng)]
+    job_ids = [int(j) for j in rng.integers(0, jobs, queries)]
+    results = []
+
+    async with engine.begin() as conn:
+        print(f"\n--- VECTOR BENCHMARK: {rows:,} rows over {jobs} jobs, dim {dim} ---")
+        await build_table(conn, table, rows, dim, jobs)
+        truth = await exact_neighbours(conn, table, query_vectors, k)
+        filtered_truth = await exact_neighbours(conn, table, query_vectors, k, job_ids)
+
+        for ef_search in EF_SEARCH_VALUES:
+            await conn.execute(text(f"SET hnsw.ef_search = {ef_search}"))
+            results.append({
+                "rows": rows, "ef_search": ef_search, "query": "global",
+                **await measure(conn, table, query_vectors, truth, k),
+            })
+            # Per-job queries, as the knowledge base issues them
+            for mode in ITERATIVE_SCAN_MODES:
+                await conn.execute(text(f"SET hnsw.iterative_scan = {mode}"))
+                results.append({
+                    "rows": rows, "ef_search": ef_search, "query": f"job, iterative={mode}",
+                    **await measure(conn, table, query_vectors, filtered_truth, k, job_ids),
+                })
+            await conn.execute(text("RESET hnsw.iterative_scan"))
+
+        await conn.execute(text(f"DROP TABLE {table}"))
+    return results
+
+
+async def main(args):
+    report = []
+    for rows in args.rows:
+        report.extend(await benchmark(rows, args.dim, args.queries, args.k, args.jobs))
+
+    print(
+        f"\n{'rows':>10} {'ef_search':>10} {'query':>26} {'recall@' + str(args.k):>10} "
+        f"{'returned':>9} {'p50 ms':>10} {'p95 ms':>10}"
+    )
+    for r in report:
+        print(
+            f"{r['rows']:>10,} {r['ef_search']:>10} {r['query']:>26} {r['recall']:>10.3f} "
+            f"{r['returned']:>9.2f} {r['p50_ms']:>10.2f} {r['p95_ms']:>10.2f}"
+        )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recall vs latency of the HNSW index at different ef_search values, globally and per job."
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=1024, help="Matches mistral-embed by default")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=1000, help="Distinct job ids the rows are spread over")
+    asyncio.run(main(parser.parse_args()))
@@ -1,12 +1,9 @@
 # scripts/eval_rag.py
 import asyncio
 from typing import List, Dict
-from langchain_mistralai import ChatMistralAI
 from langchain_core.messages import SystemMessage, HumanMessage
 from app.services.knowledge_service import kb_service
-from app.core.config import settings
-
-llm = ChatMistralAI(model="mistral-small-latest", temperature=0)
+from app.services.llm_registry import get_llm
 
 async def evaluate_faithfulness(answer: str, context: str) -> float:
     """
@@ -18,7 +15,7 @@ async def evaluate_faithfulness(answer: str, context: str) -> float:
         HumanMessage(content=f"CONTEXT: {context}\n\nSTUDENT ANSWER: {answer}\n\n"
                              "Output only a JSON with 'score' (0-1) and 'reason'.")
     ]
-    response = await llm.ainvoke(prompt)
+    response = await get_llm().ainvoke(prompt)
     # Simplified parsing for the example
     import json
     try: